@@ -0,0 +1,157 @@
+"""Pool pressure of cache-served task reads with eager vs lazy DB sessions.
+
+Drives get_all_tasks and get_vital_tasks in-process through the ASGI app, with
+the task cache warm, once with the session dependencies as they were before
+LazySession (a session per request) and once as they are now. Uses the
+database and Redis from the app's environment (.env); the seeded user and
+tasks are removed afterwards.
+
+    PYTHONPATH=src python benchmarks/cached_reads_load.py
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from datetime import timedelta
+
+import httpx
+from fastapi import Request
+from sqlalchemy import event, text
+
+from api.auth.auth_jwt.service import security
+from db.engine import (engine, get_read_session, get_session,
+                       primary_session_factory, read_session_factory)
+from main import app
+from redis_utils.client import init_redis
+
+ENDPOINTS = ("/users/tasks/get_all_tasks", "/users/tasks/get_vital_tasks")
+
+SEED_USER = text(
+    "INSERT INTO users (email) VALUES ('bench-' || gen_random_uuid() || '@example.com') "
+    "RETURNING id"
+)
+SEED_TASKS = text(
+    "INSERT INTO tasks (user_id, title, description, priority, deadline) "
+    "SELECT :user_id, 'task ' || n, 'description ' || n, "
+    "(ARRAY['LOW', 'MODERATE', 'EXTREME'])[1 + n % 3]::taskpriority, "
+    "current_date + n % 90 FROM generate_series(1, :count) n"
+)
+CLEANUP = (
+    text("DELETE FROM tasks WHERE user_id = :user_id"),
+    text("DELETE FROM users WHERE id = :user_id"),
+)
+
+
+# get_session and get_read_session as they were before LazySession
+async def eager_session(request: Request):
+    factory = await primary_session_factory(request=request)
+    async with factory() as session:
+        yield session
+
+
+async def eager_read_session(request: Request):
+    factory = await read_session_factory(request=request)
+    async with factory() as session:
+        yield session
+
+
+class PoolCounter:
+    def __init__(self):
+        self.checkouts = 0
+        self.checked_out = 0
+        self.peak = 0
+        event.listen(engine.sync_engine, "checkout", self.on_checkout)
+        event.listen(engine.sync_engine, "checkin", self.on_checkin)
+
+    def on_checkout(self, *args):
+        self.checkouts += 1
+        self.checked_out += 1
+        self.peak = max(self.peak, self.checked_out)
+
+    def on_checkin(self, *args):
+        self.checked_out -= 1
+
+    def reset(self):
+        self.checkouts = 0
+        self.peak = self.checked_out
+
+
+async def load(client: httpx.AsyncClient, headers: dict, args) -> list:
+    latencies = []
+    remaining = iter(range(args.requests))
+
+    async def worker():
+        for number in remaining:
+            started = time.perf_counter()
+            response = await client.get(ENDPOINTS[number % 2], headers=headers)
+            latencies.append(time.perf_counter() - started)
+            response.raise_for_status()
+
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    return latencies
+
+
+async def run(args: argparse.Namespace) -> None:
+    if args.fakeredis:
+        import fakeredis
+
+        app.state.redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+        app.state.redis_bytes = fakeredis.aioredis.FakeRedis()
+    else:
+        app.state.redis = await init_redis()
+        app.state.redis_bytes = await init_redis(decode_responses=False)
+
+    async with engine.begin() as connection:
+        user_uuid = str(await connection.scalar(SEED_USER))
+        await connection.execute(SEED_TASKS, {"user_id": user_uuid, "count": args.tasks})
+    headers = {
+        "Authorization": "Bearer "
+        + security.create_access_token(uid=user_uuid, expiry=timedelta(hours=1))
+    }
+    counter = PoolCounter()
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            print(
+                f"{args.requests} cached reads, concurrency {args.concurrency}, "
+                f"{args.tasks} tasks"
+            )
+            for name, overrides in (
+                ("eager session", {get_session: eager_session,
+                                   get_read_session: eager_read_session}),
+                ("lazy session", {}),
+            ):
+                app.dependency_overrides = overrides
+                for endpoint in ENDPOINTS:
+                    (await client.get(endpoint, headers=headers)).raise_for_status()
+                counter.reset()
+                started = time.perf_counter()
+                latencies = sorted(await load(client, headers, args))
+                elapsed = time.perf_counter() - started
+                print(
+                    f"{name:>14}: {args.requests / elapsed:7.0f} req/s  "
+                    f"p50 {statistics.median(latencies) * 1e3:6.2f} ms  "
+                    f"p99 {latencies[int(len(latencies) * 0.99)] * 1e3:6.2f} ms  "
+                    f"pool checkouts {counter.checkouts}  peak in use {counter.peak}"
+                )
+    finally:
+        app.dependency_overrides = {}
+        async with engine.begin() as connection:
+            for statement in CLEANUP:
+                await connection.execute(statement, {"user_id": user_uuid})
+        await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--tasks", type=int, default=200)
+    parser.add_argument(
+        "--fakeredis", action="store_true", help="use an in-process Redis stand-in"
+    )
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Cost of serving a cached task list: decode and re-encode vs pre-encoded bytes.
+
+Run from the repository root with the app's environment (.env) available:
+
+    PYTHONPATH=src python benchmarks/cached_tasks.py
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from fastapi.encoders import jsonable_encoder
+
+from api.users.tasks.crud_redis import (FRESH_UNTIL_FIELD, encode_json,
+                                        get_tasks_hash_r)
+
+SIZES = (10, 1000, 10000)
+
+
+def make_task(task_id: int) -> dict:
+    return {
+        "id": task_id,
+        "title": f"Task number {task_id}",
+        "description": "Pick up the parcel before the office closes",
+        "status": "NOT_STARTED",
+        "priority": "MODERATE",
+        "deadline": "24/12/2026",
+        "task_img": None,
+        "task_img_variants": None,
+    }
+
+
+# HGETALL as redis-py returns it with decode_responses=False
+class CachedHash:
+    def __init__(self, mapping: dict):
+        self.mapping = mapping
+
+    async def hgetall(self, key: str) -> dict:
+        return dict(self.mapping)
+
+
+# What a cache hit cost before: json.loads, then jsonable_encoder and json.dumps
+def decode_reencode(cached: str) -> bytes:
+    return json.dumps(jsonable_encoder(json.loads(cached))).encode()
+
+
+async def pre_encoded(redis: CachedHash) -> bytes:
+    body, _ = await get_tasks_hash_r(redis=redis, key="tasks")
+    return body
+
+
+def best_of(repeat: int, number: int, call) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            call()
+        timings.append((time.perf_counter() - started) / number)
+    return min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    loop = asyncio.new_event_loop()
+    print(f"{'tasks':>6} {'decode+encode':>14} {'pre-encoded':>12} {'speedup':>8}")
+    for size in SIZES:
+        tasks = [make_task(task_id) for task_id in range(1, size + 1)]
+        cached = json.dumps(tasks)
+        cached_hash = {str(task["id"]).encode(): encode_json(task) for task in tasks}
+        cached_hash[FRESH_UNTIL_FIELD.encode()] = str(time.time() + 100).encode()
+        redis = CachedHash(mapping=cached_hash)
+
+        body = loop.run_until_complete(pre_encoded(redis))
+        assert json.loads(body) == json.loads(decode_reencode(cached))
+
+        number = max(1, 20000 // size)
+        old = best_of(args.repeat, number, lambda: decode_reencode(cached))
+        new = best_of(
+            args.repeat, number, lambda: loop.run_until_complete(pre_encoded(redis))
+        )
+        print(
+            f"{size:>6} {old * 1e6:>12.1f}us {new * 1e6:>10.1f}us "
+            f"{old / new:>7.1f}x  ({len(body)} bytes)"
+        )
+    loop.close()
+
+
+if __name__ == "__main__":
+    main()
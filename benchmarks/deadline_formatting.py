@@ -0,0 +1,80 @@
+"""Per-row cost of turning deadlines into dd/mm/yyyy on 100k-row results.
+
+Compares the old path, DDMMYYYY.process_result_value running strftime on
+every row, with native dates formatted through the memoized format_deadline.
+The cold column clears format_deadline's cache before every run, the warm
+column reuses it as a long-running API process does.
+
+Run from the repository root with the app's environment (.env) available:
+
+    PYTHONPATH=src python benchmarks/deadline_formatting.py
+"""
+import argparse
+import random
+import time
+from datetime import date, timedelta
+
+from sqlalchemy.dialects import postgresql
+
+from api.users.tasks.service import format_deadline
+from db.types import DDMMYYYY
+
+ROWS = 100_000
+DAYS = 365
+
+
+def best_of(repeat: int, call) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=ROWS)
+    parser.add_argument("--days", type=int, default=DAYS)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    start = date.today()
+    deadlines = [
+        start + timedelta(days=rng.randrange(args.days)) for _ in range(args.rows)
+    ]
+    # What SQLAlchemy runs per row for a DDMMYYYY column
+    process = DDMMYYYY().result_processor(postgresql.dialect(), None)
+    assert [process(d) for d in deadlines] == [format_deadline(d) for d in deadlines]
+
+    def cold():
+        format_deadline.cache_clear()
+        for deadline in deadlines:
+            format_deadline(deadline)
+
+    def warm():
+        for deadline in deadlines:
+            format_deadline(deadline)
+
+    old = best_of(args.repeat, lambda: [process(d) for d in deadlines])
+    new_cold = best_of(args.repeat, cold)
+    warm()
+    new_warm = best_of(args.repeat, warm)
+
+    print(f"{args.rows} rows over {args.days} distinct days")
+    print(f"{'path':<32} {'total':>10} {'per row':>10}")
+    for label, seconds in (
+        ("DDMMYYYY.process_result_value", old),
+        ("format_deadline (cold cache)", new_cold),
+        ("format_deadline (warm cache)", new_warm),
+    ):
+        print(
+            f"{label:<32} {seconds * 1e3:>8.1f}ms "
+            f"{seconds / args.rows * 1e9:>8.0f}ns"
+        )
+    print(f"speedup {old / new_cold:.1f}x cold, {old / new_warm:.1f}x warm")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,16 @@
+from pathlib import Path
+from typing import Optional
+
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class MetricsConfig(BaseSettings):
+    # Metrics are served only with this bearer token; unset disables them
+    METRICS_TOKEN: Optional[str] = None
+
+    model_config = SettingsConfigDict(
+        env_file=Path(__file__).parent.parent.parent.parent / ".env", extra="ignore"
+    )
+
+
+metrics_config = MetricsConfig()
@@ -0,0 +1,34 @@
+import secrets
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+
+from api.metrics.config import metrics_config
+from db.engine import engine, replica_engine, replica_monitor
+from db.pool import pool_status
+
+
+async def require_metrics_token(
+    authorization: str = Header(None, alias="Authorization"),
+) -> None:
+    if metrics_config.METRICS_TOKEN is None:
+        raise HTTPException(status_code=404)
+    expected = f"Bearer {metrics_config.METRICS_TOKEN}"
+    if not secrets.compare_digest((authorization or "").encode(), expected.encode()):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+
+
+metrics_router = APIRouter(
+    prefix="/metrics", dependencies=[Depends(require_metrics_token)]
+)
+
+
+@metrics_router.get("/db_pool")
+async def get_db_pool_metrics():
+    metrics = {"primary": pool_status(engine=engine)}
+    if replica_engine is not None:
+        metrics["replica"] = {
+            **pool_status(engine=replica_engine),
+            "lag_seconds": replica_monitor.lag,
+            "in_use": replica_monitor.is_fresh,
+        }
+    return metrics
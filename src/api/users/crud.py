@@ -4,6 +4,7 @@ from sqlalchemy.engine.row import Row as AlchemyRow
 
 from db.engine import SessionDep
 from db.models import UsersTable
+from images.store import blob_url
 
 class ProfilePicNotFoundError(Exception):
     pass
@@ -38,17 +39,29 @@ async def update_user_data(
         raise HTTPException(status_code=404)
 
 
+# Runs inside the store_blob transaction
 async def set_profile_pic_db(
     user_uuid: str, 
-    picture_url: str, 
+    img_blob: str, 
     session: SessionDep
-) -> None:
-    async with session.begin():
-        stmt = (update(UsersTable).where(
-            UsersTable.id == user_uuid).values(
-            profile_pic=picture_url)
-        )
-        await session.execute(stmt)
+) -> AlchemyRow:
+    old = (
+        select(UsersTable.id, UsersTable.img_blob)
+        .where(UsersTable.id == user_uuid)
+        .with_for_update()
+        .subquery("old")
+    )
+    stmt = (
+        update(UsersTable)
+        .where(UsersTable.id == old.c.id)
+        .values(profile_pic=blob_url(img_blob), img_blob=img_blob)
+        .returning(UsersTable.img_blob, old.c.img_blob.label("old_img_blob"))
+    )
+    result = await session.execute(stmt)
+    user = result.one_or_none()
+    if user is None:
+        raise ValueError("User not found")
+    return user
 
 
 async def get_profile_pic(
@@ -0,0 +1,17 @@
+from redis.asyncio import Redis
+
+from redis_utils.versions import bump_version_r, get_version_r
+
+
+async def get_user_version_r(
+    redis: Redis,
+    user_uuid: str
+) -> str:
+    return await get_version_r(redis=redis, key=f"{user_uuid}_user_version")
+
+
+async def bump_user_version_r(
+    redis: Redis,
+    user_uuid: str
+) -> None:
+    await bump_version_r(redis=redis, key=f"{user_uuid}_user_version")
@@ -1,29 +1,40 @@
-from fastapi import (APIRouter, BackgroundTasks, File, Header, HTTPException,
-                     Response, UploadFile)
+from functools import partial
+from typing import Optional
+
+from fastapi import (APIRouter, Depends, File, Header,
+                     HTTPException, Query, Response, UploadFile)
+from redis.asyncio import Redis
 
 from api.users.schemas import UserUpdateSchema
 from api.users.crud import (ProfilePicNotFoundError, get_profile_pic, selecting_data_by_uuid,
                             set_profile_pic_db, update_user_data)
+from api.users.crud_redis import bump_user_version_r, get_user_version_r
 
-from api.users.service import (ProfilePictureError,
-                            get_user_uuid, logout, set_prof_pic)
-
-from db.engine import SessionDep
+from api.users.service import (ProfilePictureError, avatar_variant_url,
+                            current_user_uuid, etag_headers, etag_matches, logout,
+                            not_modified, set_prof_pic, version_etag)
 
-from authx.exceptions import JWTDecodeError
+from db.engine import ReadSessionDep, SessionDep
+from images.upload import ImageTooLargeError, ImageTypeError
+from redis_utils.client import get_redis
 
 users_router = APIRouter(prefix="/users")
 
 
 @users_router.get("/user_data")
 async def get_dashboard_data(
-    session: SessionDep, 
-    authorization: str = Header(None, alias="Authorization")
+    session: ReadSessionDep, 
+    response: Response,
+    user_uuid: str = Depends(current_user_uuid),
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
+    redis_client: Redis = Depends(get_redis),
 ):
     try:
-        user_uuid = await get_user_uuid(
-            auth_token=authorization
-        )
+        version = await get_user_version_r(redis=redis_client, user_uuid=user_uuid)
+        etag = version_etag(version=version)
+        if etag_matches(if_none_match=if_none_match, etag=etag):
+            return not_modified(etag=etag)
+
         user = await selecting_data_by_uuid(uuid=user_uuid, session=session)
         result = {
             "user_data": {
@@ -32,9 +43,8 @@ async def get_dashboard_data(
                 "email": user[2],
             }
         }
+        response.headers.update(etag_headers(etag=etag))
         return result
-    except JWTDecodeError:
-        raise HTTPException(status_code=401, detail="Invalid token")
     except ValueError:
         raise HTTPException(status_code=401, detail="User not found")
 
@@ -52,56 +62,58 @@ async def logout_user(
 async def update_user_payload(
     session: SessionDep,
     new_data: UserUpdateSchema,
-    authorization: str = Header(None, alias="Authorization"),
+    user_uuid: str = Depends(current_user_uuid),
+    redis_client: Redis = Depends(get_redis),
 ):
     update_creds = new_data.dict(exclude_unset=True)
-    user_uuid = await get_user_uuid(
-        auth_token=authorization
-    )
     await update_user_data( 
         user_uuid=user_uuid,
         session=session, 
         new_creds=update_creds
     )
+    await bump_user_version_r(redis=redis_client, user_uuid=user_uuid)
     return {"update data": "success"}
 
 
 @users_router.patch("/set_avatar")
 async def set_avatar_payload(
     session: SessionDep,
-    background_task: BackgroundTasks,
     profile_pic: UploadFile = File(...),
-    authorization: str = Header(None, alias="Authorization"),
+    user_uuid: str = Depends(current_user_uuid),
+    redis_client: Redis = Depends(get_redis),
 ):
     try:
-        user_uuid = await get_user_uuid(
-            auth_token=authorization
-        )
-        if profile_pic.content_type not in ["image/jpeg", "image/png"]:
-            raise HTTPException(400, "Only JPG/PNG")
-        picture_url = await set_prof_pic(
-            user_uuid=user_uuid,
-            profile_pic=profile_pic,
-        )
-        background_task.add_task(
-            set_profile_pic_db,
-            user_uuid=user_uuid,
-            picture_url=picture_url,
+        await set_prof_pic(
             session=session,
+            profile_pic=profile_pic,
+            set_reference=partial(
+                set_profile_pic_db, session=session, user_uuid=user_uuid
+            ),
         )
+        await bump_user_version_r(redis=redis_client, user_uuid=user_uuid)
+    except ImageTypeError:
+        raise HTTPException(status_code=400, detail="Only JPG/PNG")
+    except ImageTooLargeError:
+        raise HTTPException(status_code=413, detail="Picture is too large")
     except ProfilePictureError:
         raise HTTPException(status_code=500, detail="Failed to save profile picture")
 
 
 @users_router.get("/get_avatar")
 async def get_avatar(
-    session: SessionDep, 
-    authorization: str = Header(None, alias="Authorization")
+    session: ReadSessionDep, 
+    response: Response,
+    user_uuid: str = Depends(current_user_uuid),
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
+    size: Optional[int] = Query(None, gt=0),
+    image_format: str = Query("webp", alias="format", pattern="^(webp|jpeg)$"),
+    redis_client: Redis = Depends(get_redis),
 ):
     try:
-        user_uuid = await get_user_uuid(
-            auth_token=authorization
-        )
+        version = await get_user_version_r(redis=redis_client, user_uuid=user_uuid)
+        etag = version_etag(version=f"{version}-{size}-{image_format}")
+        if etag_matches(if_none_match=if_none_match, etag=etag):
+            return not_modified(etag=etag)
 
         profile_pic = await get_profile_pic(
             user_uuid=user_uuid, 
@@ -111,4 +123,9 @@ async def get_avatar(
     except ProfilePicNotFoundError:
         raise HTTPException(status_code=404, detail='Profile pic is absent')
 
+    if size is not None:
+        profile_pic = avatar_variant_url(
+            profile_pic=profile_pic, size=size, fmt=image_format
+        )
+    response.headers.update(etag_headers(etag=etag))
     return {"profile_pic": profile_pic}
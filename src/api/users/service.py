@@ -1,9 +1,14 @@
-import aiofiles
+from typing import Any, Awaitable, Callable, Optional
+
 from authx.exceptions import JWTDecodeError
-from fastapi import HTTPException, Response, UploadFile
+from fastapi import Header, HTTPException, Request, Response, UploadFile
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from api.auth.auth_jwt.service import security
-from api.users.config import PROFILE_PHOTO_UPLOAD_DIR, PROFILE_PHOTO_URL
+from images.config import BLOBS_URL
+from images.store import store_blob
+from images.upload import ImageUploadError
+from images.variants import pick_variant_size, variant_name
 
 class ProfilePictureError(Exception):
     pass
@@ -23,6 +28,19 @@ async def get_user_uuid(auth_token) -> str:
         raise JWTDecodeError()
 
 
+# Resolved once per request, the session factories read it from request.state
+async def current_user_uuid(
+    request: Request,
+    authorization: str = Header(None, alias="Authorization"),
+) -> str:
+    try:
+        user_uuid = await get_user_uuid(auth_token=authorization)
+    except JWTDecodeError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    request.state.user_uuid = user_uuid
+    return user_uuid
+
+
 async def logout(response: Response) -> None:
     try:
         response.delete_cookie(key="refresh_token", path="/")
@@ -32,16 +50,46 @@ async def logout(response: Response) -> None:
         raise HTTPException(status_code=404)
 
 
+# Only blob avatars have variants, older uploads and Google pictures are
+# passed through
+def avatar_variant_url(profile_pic: str, size: int, fmt: str) -> str:
+    if not profile_pic.startswith(BLOBS_URL):
+        return profile_pic
+    return variant_name(profile_pic, pick_variant_size(size), fmt)
+
+
 async def set_prof_pic(
-    user_uuid: str,
+    session: AsyncSession,
     profile_pic: UploadFile,
+    set_reference: Callable[..., Awaitable[Any]],
 ) -> str:
-    filepath = PROFILE_PHOTO_UPLOAD_DIR / f"{user_uuid}.jpeg"
     try:
-        async with aiofiles.open(filepath, mode="wb") as f:
-            content = await profile_pic.read()
-            await f.write(content)
-        return str(PROFILE_PHOTO_URL + f"{user_uuid}.jpeg")
+        user = await store_blob(
+            session=session, upload=profile_pic, set_reference=set_reference
+        )
+        return user.img_blob
 
+    except ImageUploadError:
+        raise
     except Exception as e:
-        raise ProfilePictureError() from e
\ No newline at end of file
+        raise ProfilePictureError() from e
+
+
+# ETags are weak because the same version may be sent gzip or brotli encoded
+def version_etag(version: str) -> str:
+    return f'W/"{version}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers=etag_headers(etag=etag))
+
+
+def etag_headers(etag: str) -> dict:
+    return {"ETag": etag, "Cache-Control": "private, no-cache"}
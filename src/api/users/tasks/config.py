@@ -3,3 +3,10 @@ from pathlib import Path
 TASKS_FOLDER_BASE_DIR = Path(__file__).resolve().parent.parent.parent.parent.parent
 TASK_UPLOAD_DIR = TASKS_FOLDER_BASE_DIR / "uploads" / "task_images"
 TASK_IMG_URL = "http://localhost:8000/uploads/task_images/"
+
+COMPLETED_TASKS_LIMIT = 5
+TASKS_BATCH_LIMIT = 500
+TASKS_EXPORT_CHUNK_SIZE = 1000
+TASKS_IMPORT_CHUNK_SIZE = 1000
+TASKS_IMPORT_MAX_ROWS = 100000
+TASKS_IMPORT_MAX_ERRORS = 100
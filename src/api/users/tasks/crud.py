@@ -1,67 +1,231 @@
-from typing import Any, List
-
-from sqlalchemy import delete, insert, select, update
+from datetime import date, datetime
+from itertools import islice
+from typing import Any, AsyncIterator, Iterable, Iterator, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import (Float, Integer, any_, case, column, delete, exists, func,
+                        insert, literal, or_, select, text, tuple_, union_all,
+                        update)
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.sql import table as table_clause
 from sqlalchemy.exc import SQLAlchemyError
 
-from api.users.tasks.service import serialize_TaskTable_obj_data
+from api.users.tasks.config import (COMPLETED_TASKS_LIMIT, TASKS_EXPORT_CHUNK_SIZE,
+                                    TASKS_IMPORT_CHUNK_SIZE)
 from db.engine import SessionDep
-from db.models import CompletedTasksTable, TaskPriority, TasksTable
+from db.models import CompletedTasksTable, TaskPriority, TasksTable, TaskStatus
+
+
+def task_columns(table) -> tuple:
+    return (
+        table.id,
+        table.title,
+        table.description,
+        table.status,
+        table.priority,
+        table.deadline,
+        table.img_blob,
+    )
+
+
+def any_id(column, ids: List[int]):
+    return column == any_(literal(ids, ARRAY(Integer)))
 
 
 async def create_task_in_db(
     session: SessionDep, 
     user_uuid: str, 
     task_data: dict
-) -> int:
+) -> Any:
     async with session.begin():
         task_data["user_id"] = user_uuid
         stmt = insert(TasksTable).values(
             **task_data).returning(
-            TasksTable.id)
+            *task_columns(TasksTable))
 
         result = await session.execute(stmt)
-        task_id = result.scalar_one_or_none()
 
-        return task_id
+        return result.one()
+
+
+async def create_tasks_in_db(
+    session: SessionDep,
+    user_uuid: str,
+    tasks_data: List[dict],
+) -> List[Any]:
+    rows = [
+        {"status": TaskStatus.NOT_STARTED.value, **task_data, "user_id": user_uuid}
+        for task_data in tasks_data
+    ]
+    async with session.begin():
+        stmt = insert(TasksTable).returning(
+            *task_columns(TasksTable), sort_by_parameter_order=True
+        )
+        result = await session.execute(stmt, rows)
+
+        return result.all()
+
+
+IMPORT_COLUMNS = ("user_id", "title", "description", "status", "priority", "deadline")
+IMPORT_STAGING_TABLE = "tasks_import"
+
+import_staging = table_clause(
+    IMPORT_STAGING_TABLE, *(column(name) for name in IMPORT_COLUMNS)
+)
+
+
+def take_chunk(records: Iterator[tuple], chunk_size: int) -> List[tuple]:
+    return list(islice(records, chunk_size))
+
+
+# Rows are COPYed into a temp table first so a single INSERT ... RETURNING can
+# report exactly which tasks this import created. Each chunk is pulled from
+# records in a worker thread, so parsing never blocks the event loop
+async def copy_tasks_to_db(
+    session: SessionDep,
+    user_uuid: str,
+    records: Iterable[tuple],
+    chunk_size: int = TASKS_IMPORT_CHUNK_SIZE,
+) -> tuple[int, List[Any]]:
+    records = iter(records)
+    imported = 0
+    async with session.begin():
+        # Goes through the session before any COPY so the driver connection is
+        # already inside this transaction and a failed chunk rolls back them all
+        await session.execute(
+            text(
+                f"CREATE TEMP TABLE {IMPORT_STAGING_TABLE} ON COMMIT DROP AS "
+                f"SELECT {', '.join(IMPORT_COLUMNS)} FROM {TasksTable.__tablename__} "
+                "WITH NO DATA"
+            )
+        )
+        connection = await session.connection()
+        raw_connection = await connection.get_raw_connection()
+        driver_connection = raw_connection.driver_connection
+
+        while chunk := await run_in_threadpool(take_chunk, records, chunk_size):
+            await driver_connection.copy_records_to_table(
+                IMPORT_STAGING_TABLE,
+                records=chunk,
+                columns=IMPORT_COLUMNS,
+            )
+            imported += len(chunk)
+
+        inserted = (
+            insert(TasksTable)
+            .from_select(IMPORT_COLUMNS, select(*import_staging.c))
+            .returning(TasksTable.id, TasksTable.deadline, TasksTable.status)
+            .cte("inserted")
+        )
+        result = await session.execute(
+            select(inserted.c.id, inserted.c.deadline).where(
+                inserted.c.status != TaskStatus.DONE.value
+            )
+        )
+
+        return imported, result.all()
 
 
 async def change_task_status(
     session: SessionDep, user_uuid: str, task_id: int, new_status: str = "IN_PROGRESS"
-) -> None:
+) -> Any:
     async with session.begin():
         stmt = (
             update(TasksTable)
             .values(status=new_status)
             .filter(TasksTable.user_id == user_uuid, TasksTable.id == task_id)
+            .returning(*task_columns(TasksTable))
         )
         result = await session.execute(stmt)
+        task = result.one_or_none()
 
-        if result.rowcount == 0:
+        if task is None:
             raise ValueError("Task not found")
 
+        return task
+
+
+async def change_tasks_status(
+    session: SessionDep,
+    user_uuid: str,
+    task_ids: List[int],
+    new_status: str = "IN_PROGRESS",
+) -> List[Any]:
+    async with session.begin():
+        stmt = (
+            update(TasksTable)
+            .values(status=new_status)
+            .filter(TasksTable.user_id == user_uuid, any_id(TasksTable.id, task_ids))
+            .returning(*task_columns(TasksTable))
+        )
+        result = await session.execute(stmt)
+
+        return result.all()
+
 
 async def select_all_tasks(
     session: SessionDep, 
     user_uuid: str
 ) -> List[Any]:
-    all_tasks: List[Any] = []
-
     async with session.begin():
-        stmt = select(TasksTable).where(TasksTable.user_id == user_uuid)
-        stmt1 = select(CompletedTasksTable).where(
-            CompletedTasksTable.user_id == user_uuid
+        query = union_all(
+            select(
+                *task_columns(CompletedTasksTable), literal(True).label("completed")
+            ).where(CompletedTasksTable.user_id == user_uuid),
+            select(
+                *task_columns(TasksTable), literal(False).label("completed")
+            ).where(TasksTable.user_id == user_uuid),
         )
+        result = await session.execute(query)
 
-        result = await session.execute(stmt)
-        result1 = await session.execute(stmt1)
+        return result.all()
 
-        not_completed_tasks = result.scalars().all()
-        completed_tasks = result1.scalars().all()
 
-        all_tasks.extend(completed_tasks)
-        all_tasks.extend(not_completed_tasks)
+async def stream_all_tasks(
+    session: SessionDep,
+    user_uuid: str,
+    chunk_size: int = TASKS_EXPORT_CHUNK_SIZE,
+) -> AsyncIterator[List[Any]]:
+    query = union_all(
+        select(*task_columns(CompletedTasksTable), CompletedTasksTable.created_at).where(
+            CompletedTasksTable.user_id == user_uuid
+        ),
+        select(*task_columns(TasksTable), TasksTable.created_at).where(
+            TasksTable.user_id == user_uuid
+        ),
+    ).execution_options(yield_per=chunk_size)
+
+    async with session.begin():
+        result = await session.stream(query)
+        async for rows in result.partitions():
+            yield rows
+
+
+async def select_tasks_page(
+    session: SessionDep,
+    user_uuid: str,
+    limit: int,
+    after: Optional[tuple[datetime, int]] = None,
+) -> List[Any]:
+    pages = []
+    for table in (TasksTable, CompletedTasksTable):
+        stmt = select(*task_columns(table), table.created_at).where(
+            table.user_id == user_uuid
+        )
+        if after is not None:
+            stmt = stmt.where(tuple_(table.created_at, table.id) > tuple_(*after))
+        pages.append(stmt.order_by(table.created_at, table.id).limit(limit))
+
+    merged = union_all(*pages).subquery()
+    query = (
+        select(merged)
+        .order_by(merged.c.created_at, merged.c.id)
+        .limit(limit)
+    )
 
-        return all_tasks
+    async with session.begin():
+        result = await session.execute(query)
+        return result.all()
 
 
 async def select_vital_tasks(
@@ -69,14 +233,36 @@ async def select_vital_tasks(
     user_uuid: str,
 ):
     async with session.begin():
-        query = select(TasksTable).where(
+        query = select(*task_columns(TasksTable)).where(
             TasksTable.user_id == user_uuid,
             TasksTable.priority == TaskPriority.EXTREME.value,
-        )
+        ).order_by(TasksTable.created_at, TasksTable.id)
 
         result = await session.execute(query)
 
-        return result.scalars().all()
+        return result.all()
+
+
+async def select_due_tasks(
+    session: SessionDep,
+    user_uuid: str,
+    due_before: date,
+    due_after: Optional[date],
+    limit: int,
+) -> List[Any]:
+    # The status is inlined so the planner can match the open tasks partial index
+    query = select(*task_columns(TasksTable)).where(
+        TasksTable.user_id == user_uuid,
+        TasksTable.status != literal(TaskStatus.DONE.value, literal_execute=True),
+        TasksTable.deadline <= due_before,
+    )
+    if due_after is not None:
+        query = query.where(TasksTable.deadline >= due_after)
+    query = query.order_by(TasksTable.deadline, TasksTable.id).limit(limit)
+
+    async with session.begin():
+        result = await session.execute(query)
+        return result.all()
 
 
 async def edit_task_data(
@@ -90,120 +276,254 @@ async def edit_task_data(
             update(TasksTable)
             .values(**task_data)
             .filter(TasksTable.user_id == user_uuid, TasksTable.id == task_id)
+            .returning(*task_columns(TasksTable))
         )
         result = await session.execute(stmt)
+        task = result.one_or_none()
 
-        if result.rowcount == 0:
+        if task is None:
             raise ValueError("Task not found")
 
-        return {"task updated": "true"}
+        return task
 
 
-async def get_task_to_complete(
-    session: SessionDep, 
-    user_uuid: str, 
-    task_id: int
-) -> dict:
-    async with session.begin():
-        query = select(TasksTable).filter(
-            TasksTable.user_id == user_uuid, TasksTable.id == task_id
-        )
-        result = await session.execute(query)
-        task = result.scalars().all()
-
-        if not task:
-            raise ValueError("Task is absent")
-
-        serialized_task = await serialize_TaskTable_obj_data(task_obj=task[0])
-
-        return serialized_task
+# Runs inside the store_blob transaction
+async def set_task_img_blob(
+    session: SessionDep,
+    user_uuid: str,
+    task_id: int,
+    img_blob: str,
+) -> Any:
+    old = (
+        select(TasksTable.id, TasksTable.img_blob)
+        .where(TasksTable.user_id == user_uuid, TasksTable.id == task_id)
+        .with_for_update()
+        .subquery("old")
+    )
+    stmt = (
+        update(TasksTable)
+        .where(TasksTable.id == old.c.id)
+        .values(img_blob=img_blob)
+        .returning(*task_columns(TasksTable), old.c.img_blob.label("old_img_blob"))
+    )
+    result = await session.execute(stmt)
+    task = result.one_or_none()
+    if task is None:
+        raise ValueError("Task not found")
+    return task
 
 
 async def replace_tasks_between_tables(
     session: SessionDep, 
-    task: dict, 
     user_uuid: str, 
     task_id: int
-) -> tuple[bool | None, int | None]:
-    img_to_delete: bool | None = None
-    task_id_to_delete: int | None = None
-
-    try:
-        async with session.begin():
-            stmt = (
-                select(CompletedTasksTable)
-                .filter(CompletedTasksTable.user_id == user_uuid)
-                .order_by(CompletedTasksTable.created_at.asc())
-            )
-
-            result = await session.execute(stmt)
-            completed_tasks_list = result.scalars().all()
-
-            if len(completed_tasks_list) >= 5:
-                oldest_task = completed_tasks_list[0]
-                await session.delete(oldest_task)
-                await session.flush()
-                task_id_to_delete = oldest_task.id
-                img_to_delete = True
-
-            new_task = CompletedTasksTable(**task)
-            session.add(new_task)
+) -> tuple[Any, List[int], List[str]]:
+    completed_tasks, evicted_ids, dropped_ids, old_blobs = await complete_tasks_db(
+        session=session, user_uuid=user_uuid, task_ids=[task_id]
+    )
+    if not completed_tasks:
+        raise ValueError("Task is absent")
 
-            stmt = await delete_task_from_Task_table(task_id=task_id, user_uuid=user_uuid)
-            await session.execute(stmt)
+    return completed_tasks[0], evicted_ids + dropped_ids, old_blobs
 
-        return img_to_delete, task_id_to_delete
 
-    except :
-        raise SQLAlchemyError()
+# Returns the completed tasks, the older completed tasks evicted to make room,
+# the moved tasks that did not fit in the history at all and the blobs those
+# two lost a reference to
+async def complete_tasks_db(
+    session: SessionDep,
+    user_uuid: str,
+    task_ids: List[int],
+) -> tuple[List[Any], List[int], List[int], List[str]]:
+    moved_columns = (
+        TasksTable.id,
+        TasksTable.user_id,
+        TasksTable.title,
+        TasksTable.description,
+        TasksTable.priority,
+        TasksTable.deadline,
+        TasksTable.img_blob,
+        TasksTable.created_at,
+        TasksTable.updated_at,
+    )
+    moved = (
+        delete(TasksTable)
+        .where(TasksTable.user_id == user_uuid, any_id(TasksTable.id, task_ids))
+        .returning(*moved_columns)
+        .cte("moved")
+    )
+    moved_ranked = select(
+        *moved.c,
+        func.row_number()
+        .over(order_by=(moved.c.created_at.desc(), moved.c.id.desc()))
+        .label("position"),
+    ).cte("moved_ranked")
+    inserted = (
+        insert(CompletedTasksTable)
+        .from_select(
+            [column.key for column in moved_columns],
+            select(
+                *[moved_ranked.c[column.key] for column in moved_columns]
+            ).where(moved_ranked.c.position <= COMPLETED_TASKS_LIMIT),
+        )
+        .returning(*task_columns(CompletedTasksTable))
+        .cte("inserted")
+    )
+    moved_count = select(func.count()).select_from(moved).scalar_subquery()
+    # Ranked before the insert, so the moved tasks always survive the trim
+    ranked = (
+        select(
+            CompletedTasksTable.id,
+            func.row_number()
+            .over(
+                order_by=(
+                    CompletedTasksTable.created_at.desc(),
+                    CompletedTasksTable.id.desc(),
+                )
+            )
+            .label("position"),
+        )
+        .where(CompletedTasksTable.user_id == user_uuid)
+        .cte("ranked")
+    )
+    evicted = (
+        delete(CompletedTasksTable)
+        .where(
+            CompletedTasksTable.id == ranked.c.id,
+            ranked.c.position > COMPLETED_TASKS_LIMIT - moved_count,
+            exists(select(moved.c.id)),
+        )
+        .returning(CompletedTasksTable.id, CompletedTasksTable.img_blob)
+        .cte("evicted")
+    )
+    dropped = (
+        select(moved_ranked.c.id, moved_ranked.c.img_blob)
+        .where(moved_ranked.c.position > COMPLETED_TASKS_LIMIT)
+        .cte("dropped")
+    )
+    old_blobs = union_all(
+        select(evicted.c.img_blob), select(dropped.c.img_blob)
+    ).subquery("old_blobs")
+    query = select(
+        *inserted.c,
+        select(func.array_agg(evicted.c.id)).scalar_subquery().label("evicted_ids"),
+        select(func.array_agg(dropped.c.id)).scalar_subquery().label("dropped_ids"),
+        select(func.array_agg(old_blobs.c.img_blob))
+        .where(old_blobs.c.img_blob.is_not(None))
+        .scalar_subquery()
+        .label("old_blobs"),
+    ).order_by(inserted.c.id)
 
+    async with session.begin():
+        result = await session.execute(query)
+        completed_tasks = result.all()
 
+    if not completed_tasks:
+        return [], [], [], []
 
-async def delete_task_from_Task_table(task_id: int, user_uuid: str):
-    return (
-        delete(TasksTable)
-        .where(TasksTable.id == task_id)
-        .where(TasksTable.user_id == user_uuid)
-    )
+    evicted_ids = completed_tasks[0].evicted_ids or []
+    dropped_ids = completed_tasks[0].dropped_ids or []
+    old_blobs = completed_tasks[0].old_blobs or []
+    return completed_tasks, evicted_ids, dropped_ids, old_blobs
 
 
 async def search_tasks_by_name(
     session: SessionDep,
     user_uuid: str,
     task_name: str,
-):
+    limit: int = 20,
+) -> List[Any]:
+    term = (
+        task_name.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    )
+    found = []
+    for table in (TasksTable, CompletedTasksTable):
+        rank = (
+            case((table.title.ilike(f"{term}%", escape="\\"), 1.0), else_=0.0)
+            + func.word_similarity(task_name, table.title, type_=Float)
+            + func.word_similarity(task_name, table.description, type_=Float) * 0.5
+        )
+        stmt = (
+            select(*task_columns(table), rank.label("rank"))
+            .where(
+                table.user_id == user_uuid,
+                or_(
+                    table.title.ilike(f"%{term}%", escape="\\"),
+                    table.description.ilike(f"%{term}%", escape="\\"),
+                ),
+            )
+            .order_by(rank.desc())
+            .limit(limit)
+        )
+        found.append(stmt)
+
+    merged = union_all(*found).subquery()
+    query = select(merged).order_by(merged.c.rank.desc(), merged.c.id.desc()).limit(limit)
+
     async with session.begin():
         try:
-            query = select(TasksTable).filter(
-                TasksTable.user_id == user_uuid,
-                TasksTable.title.ilike(f"%{task_name}%"),
-            )
             result = await session.execute(query)
 
-            return result.scalars().all()
+            return result.all()
         except:
             raise SQLAlchemyError()
 
 
+# Returns the blobs the deleted task referenced
 async def delete_task_db(
     session: SessionDep, 
     task_id: int, 
     user_uuid: str
-) -> None:
+) -> List[str]:
     async with session.begin():
         try:
             stmt = delete(TasksTable).filter(
                 TasksTable.user_id == user_uuid, TasksTable.id == task_id
-            )
+            ).returning(TasksTable.img_blob)
 
             result = await session.execute(stmt)
+            deleted = result.all()
 
-            if result.rowcount == 0:
-                await session.execute(
+            if not deleted:
+                result = await session.execute(
                     delete(CompletedTasksTable).filter(
                         CompletedTasksTable.user_id == user_uuid,
                         CompletedTasksTable.id == task_id,
-                    )
+                    ).returning(CompletedTasksTable.img_blob)
                 )
+                deleted = result.all()
         except Exception:
             raise ValueError("Task not found")
+
+        return [img_blob for img_blob, in deleted if img_blob]
+
+
+# Returns the deleted ids and the blobs the deleted tasks referenced
+async def delete_tasks_db(
+    session: SessionDep,
+    user_uuid: str,
+    task_ids: List[int],
+) -> tuple[List[int], List[str]]:
+    async with session.begin():
+        result = await session.execute(
+            delete(TasksTable)
+            .filter(TasksTable.user_id == user_uuid, any_id(TasksTable.id, task_ids))
+            .returning(TasksTable.id, TasksTable.img_blob)
+        )
+        deleted = result.all()
+
+        remaining_ids = sorted(set(task_ids) - {task_id for task_id, _ in deleted})
+        if remaining_ids:
+            result = await session.execute(
+                delete(CompletedTasksTable)
+                .filter(
+                    CompletedTasksTable.user_id == user_uuid,
+                    any_id(CompletedTasksTable.id, remaining_ids),
+                )
+                .returning(CompletedTasksTable.id, CompletedTasksTable.img_blob)
+            )
+            deleted.extend(result.all())
+
+        deleted_ids = [task_id for task_id, _ in deleted]
+        old_blobs = [img_blob for _, img_blob in deleted if img_blob]
+        return deleted_ids, old_blobs
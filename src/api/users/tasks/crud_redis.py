@@ -1,43 +1,527 @@
 from redis.asyncio import Redis
-from typing import List, Optional
+from datetime import date, datetime, time as day_time, timezone
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Union
+from uuid import uuid4
+import asyncio
 import json
+import random
+import time
+
+from fastapi import BackgroundTasks
+from redis.exceptions import WatchError
+
+from db.models import TaskPriority, TaskStatus
+from redis_utils.versions import bump_version_lua, get_version_r, watch_version_r
+
+# Cached lists are served fresh until the soft TTL, then served stale while
+# a single request rebuilds them; Redis drops them after the hard TTL
+TASKS_SOFT_TTL = 100
+TASKS_HARD_TTL = 300
+TASKS_TTL_JITTER = 0.1
+FRESH_UNTIL_FIELD = "_fresh_until"
+# Completed tasks are kept under prefixed fields, so a cached list can be put
+# back in select_all_tasks order: completed tasks first, then open ones
+COMPLETED_FIELD_PREFIX = "c"
+
+REBUILD_LOCK_TTL_MS = 5000
+REBUILD_WAIT_INTERVAL = 0.05
+REBUILD_WAIT_ATTEMPTS = 40
+
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# KEYS: tasks hash, vital tasks hash, tasks pages hash, tasks version,
+#       compressed responses hash, due tasks hash
+# ARGV: completed field prefix, number of upserted tasks, then
+#       (task_id, task_json, is_vital, is_completed) quadruples,
+#       then ids of removed tasks
+UPDATE_TASKS_SCRIPT = """
+local prefix = ARGV[1]
+local upserted = tonumber(ARGV[2])
+local tasks_cached = redis.call('EXISTS', KEYS[1]) == 1
+local vital_cached = redis.call('EXISTS', KEYS[2]) == 1
+
+for i = 0, upserted - 1 do
+    local task_id = ARGV[3 + i * 4]
+    local task = ARGV[4 + i * 4]
+    local field, stale_field = task_id, prefix .. task_id
+    if ARGV[6 + i * 4] == '1' then
+        field, stale_field = stale_field, field
+    end
+    if tasks_cached then
+        redis.call('HSET', KEYS[1], field, task)
+        redis.call('HDEL', KEYS[1], stale_field)
+    end
+    if ARGV[5 + i * 4] == '1' then
+        if vital_cached then
+            redis.call('HSET', KEYS[2], task_id, task)
+        end
+    else
+        redis.call('HDEL', KEYS[2], task_id)
+    end
+end
+
+for i = 3 + upserted * 4, #ARGV do
+    redis.call('HDEL', KEYS[1], ARGV[i], prefix .. ARGV[i])
+    redis.call('HDEL', KEYS[2], ARGV[i])
+end
+
+redis.call('DEL', KEYS[3], KEYS[5], KEYS[6])
+""" + bump_version_lua("KEYS[4]")
+
+DELETE_TASKS_SCRIPT = """
+redis.call('DEL', KEYS[1], KEYS[2], KEYS[3], KEYS[5], KEYS[6])
+""" + bump_version_lua("KEYS[4]")
+
+
+# Reminders fire REMINDER_LEAD_SECONDS before the start of the deadline day (UTC)
+TASK_DEADLINES_KEY = "task_deadlines"
+TASK_REMINDERS_SENT_PREFIX = "task_reminders_sent:"
+TASK_REMINDERS_STREAM = "task_reminders"
+REMINDER_LEAD_SECONDS = 24 * 3600
+REMINDERS_STREAM_MAXLEN = 100000
+# A sent marker outlives the deadline day by a day, deadlines older than
+# that are no longer scheduled
+REMINDER_SENT_KEEP_SECONDS = REMINDER_LEAD_SECONDS + 2 * 24 * 3600
+
+# KEYS: deadlines zset, then the sent marker of each member
+# ARGV: oldest score still reminded of, then (member, score) pairs; a
+#       reminder already sent for the same deadline is not scheduled again
+SCHEDULE_REMINDERS_SCRIPT = """
+for i = 2, #ARGV, 2 do
+    local sent = KEYS[i / 2 + 1]
+    if tonumber(ARGV[i + 1]) < tonumber(ARGV[1]) then
+        redis.call('ZREM', KEYS[1], ARGV[i])
+    elseif redis.call('GET', sent) ~= ARGV[i + 1] then
+        redis.call('DEL', sent)
+        redis.call('ZADD', KEYS[1], ARGV[i + 1], ARGV[i])
+    end
+end
+"""
+
+# KEYS: deadlines zset, reminders stream
+# ARGV: current timestamp, batch size, stream max length, sent marker
+#       prefix, seconds a sent marker is kept past its score
+POP_DUE_REMINDERS_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1],
+                       'WITHSCORES', 'LIMIT', 0, ARGV[2])
+for i = 1, #due, 2 do
+    local member, score = due[i], due[i + 1]
+    local separator = string.find(member, ':', 1, true)
+    local ttl = math.floor(tonumber(score) + tonumber(ARGV[5]) - tonumber(ARGV[1]))
+    redis.call('ZREM', KEYS[1], member)
+    if ttl > 0 then
+        redis.call('SET', ARGV[4] .. member, score, 'EX', ttl)
+    end
+    redis.call('XADD', KEYS[2], 'MAXLEN', '~', ARGV[3], '*',
+               'user_id', string.sub(member, 1, separator - 1),
+               'task_id', string.sub(member, separator + 1),
+               'remind_at', score)
+end
+return #due / 2
+"""
+
+
+def jittered_ttl(ttl: int) -> int:
+    return round(ttl * random.uniform(1 - TASKS_TTL_JITTER, 1 + TASKS_TTL_JITTER))
+
+
+def encode_json(data) -> bytes:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def join_encoded_tasks(encoded_tasks: Iterable[bytes]) -> bytes:
+    return b"[" + b",".join(encoded_tasks) + b"]"
+
+
+def task_field(task_id: int, completed: bool = False) -> str:
+    return f"{COMPLETED_FIELD_PREFIX}{task_id}" if completed else str(task_id)
+
+
+def task_field_order(field: Union[bytes, str]) -> tuple[bool, int]:
+    if isinstance(field, bytes):
+        field = field.decode()
+    completed = field.startswith(COMPLETED_FIELD_PREFIX)
+    return not completed, int(field.removeprefix(COMPLETED_FIELD_PREFIX))
+
+
+# Cache hits and rebuilds both go through here, so they answer in one order
+def join_task_fields(encoded_tasks: dict) -> bytes:
+    return join_encoded_tasks(
+        encoded_tasks[field] for field in sorted(encoded_tasks, key=task_field_order)
+    )
+
+
+async def get_tasks_hash_r(
+    redis: Redis,
+    key: str,
+) -> Optional[tuple[bytes, bool]]:
+    result = await redis.hgetall(key)
+    if not result:
+        return None
+    fresh_until = float(result.pop(FRESH_UNTIL_FIELD.encode(), 0))
+    return join_task_fields(result), fresh_until < time.time()
+
+
+async def get_tasks_version_r(
+    redis: Redis,
+    user_uuid: str,
+) -> str:
+    return await get_version_r(redis=redis, key=f"{user_uuid}_tasks_version")
+
+
+async def set_tasks_hash_r(
+    redis: Redis,
+    key: str,
+    encoded_tasks: dict,
+    version_key: str,
+    version: str,
+) -> None:
+    mapping = dict(encoded_tasks)
+    mapping[FRESH_UNTIL_FIELD] = time.time() + jittered_ttl(TASKS_SOFT_TTL)
+
+    # Skip the write if the tasks changed while they were being loaded
+    async with redis.pipeline(transaction=True) as pipe:
+        try:
+            if not await watch_version_r(pipe=pipe, key=version_key, version=version):
+                return
+            pipe.multi()
+            pipe.delete(key)
+            pipe.hset(key, mapping=mapping)
+            pipe.expire(key, jittered_ttl(TASKS_HARD_TTL))
+            await pipe.execute()
+        except WatchError:
+            return
+
+
+async def acquire_rebuild_lock_r(
+    redis: Redis,
+    key: str,
+) -> Optional[str]:
+    token = uuid4().hex
+    acquired = await redis.set(
+        f"{key}_lock", token, nx=True, px=REBUILD_LOCK_TTL_MS
+    )
+    return token if acquired else None
+
+
+async def release_rebuild_lock_r(
+    redis: Redis,
+    key: str,
+    token: str,
+) -> None:
+    release_lock = redis.register_script(RELEASE_LOCK_SCRIPT)
+    await release_lock(keys=[f"{key}_lock"], args=[token])
+
+
+# Loaders return the tasks keyed by their hash field, see task_field
+async def rebuild_tasks_r(
+    redis: Redis,
+    key: str,
+    version_key: str,
+    loader: Callable[[], Awaitable[Dict[str, dict]]],
+) -> Optional[bytes]:
+    token = await acquire_rebuild_lock_r(redis=redis, key=key)
+    if token is None:
+        return None
+    try:
+        version = await get_version_r(redis=redis, key=version_key)
+        tasks_data = await loader()
+        encoded_tasks = {
+            field: encode_json(task) for field, task in tasks_data.items()
+        }
+        await set_tasks_hash_r(
+            redis=redis,
+            key=key,
+            encoded_tasks=encoded_tasks,
+            version_key=version_key,
+            version=version,
+        )
+        return join_task_fields(encoded_tasks)
+    finally:
+        await release_rebuild_lock_r(redis=redis, key=key, token=token)
+
+
+async def read_through_tasks_r(
+    redis: Redis,
+    key: str,
+    version_key: str,
+    loader: Callable[[], Awaitable[Dict[str, dict]]],
+    background_tasks: BackgroundTasks,
+) -> bytes:
+    cached = await get_tasks_hash_r(redis=redis, key=key)
+    if cached is not None:
+        body, is_stale = cached
+        if is_stale:
+            background_tasks.add_task(
+                rebuild_tasks_r,
+                redis=redis,
+                key=key,
+                version_key=version_key,
+                loader=loader,
+            )
+        return body
+
+    body = await rebuild_tasks_r(
+        redis=redis, key=key, version_key=version_key, loader=loader
+    )
+    if body is not None:
+        return body
+
+    # Another request is rebuilding this key, wait for its result
+    for _ in range(REBUILD_WAIT_ATTEMPTS):
+        await asyncio.sleep(REBUILD_WAIT_INTERVAL)
+        cached = await get_tasks_hash_r(redis=redis, key=key)
+        if cached is not None:
+            return cached[0]
+
+    tasks_data = await loader()
+    return join_task_fields(
+        {field: encode_json(task) for field, task in tasks_data.items()}
+    )
 
 
 async def get_tasks_r(
     redis: Redis,
     user_uuid: str,
-) -> Optional[List[dict]]:
-    result = await redis.get(f"{user_uuid}_tasks")
-    return json.loads(result) if result else None
+    loader: Callable[[], Awaitable[Dict[str, dict]]],
+    background_tasks: BackgroundTasks,
+) -> bytes:
+    return await read_through_tasks_r(
+        redis=redis,
+        key=f"{user_uuid}_tasks",
+        version_key=f"{user_uuid}_tasks_version",
+        loader=loader,
+        background_tasks=background_tasks,
+    )
 
 
 async def get_vital_tasks_r(
     redis: Redis,
     user_uuid: str,
-) -> Optional[List[dict]]:
-    result = await redis.get(f"{user_uuid}_vital_tasks")
-    return json.loads(result) if result else None
+    loader: Callable[[], Awaitable[Dict[str, dict]]],
+    background_tasks: BackgroundTasks,
+) -> bytes:
+    return await read_through_tasks_r(
+        redis=redis,
+        key=f"{user_uuid}_vital_tasks",
+        version_key=f"{user_uuid}_tasks_version",
+        loader=loader,
+        background_tasks=background_tasks,
+    )
 
 
-async def set_vital_tasks_r(
-    redis: Redis, 
-    user_uuid: str, 
-    vital_tasks: List[dict]
+async def update_tasks_r(
+    redis: Redis,
+    user_uuid: str,
+    upserted: Optional[List[dict]] = None,
+    removed_ids: Optional[List[int]] = None,
+    completed: bool = False,
 ) -> None:
-    await redis.set(f"{user_uuid}_vital_tasks", json.dumps(vital_tasks), ex=100)
+    upserted = upserted or []
+    args: list = [COMPLETED_FIELD_PREFIX, len(upserted)]
+    for task in upserted:
+        is_vital = not completed and task["priority"] == TaskPriority.EXTREME.value
+        args.extend((task["id"], encode_json(task), int(is_vital), int(completed)))
+    args.extend(removed_ids or [])
 
+    update_tasks = redis.register_script(UPDATE_TASKS_SCRIPT)
+    await update_tasks(
+        keys=[
+            f"{user_uuid}_tasks",
+            f"{user_uuid}_vital_tasks",
+            f"{user_uuid}_tasks_pages",
+            f"{user_uuid}_tasks_version",
+            f"{user_uuid}_tasks_compressed",
+            f"{user_uuid}_due_tasks",
+        ],
+        args=args,
+    )
 
-async def set_tasks_r(
-    redis: Redis, 
-    user_uuid: str, 
-    tasks_data: List[dict]
+    scheduled, unscheduled = {}, list(removed_ids or [])
+    for task in upserted:
+        if completed or task["status"] == TaskStatus.DONE.value:
+            unscheduled.append(task["id"])
+        else:
+            scheduled[task["id"]] = task["deadline"]
+    await schedule_reminders_r(redis=redis, user_uuid=user_uuid, deadlines=scheduled)
+    await unschedule_reminders_r(redis=redis, user_uuid=user_uuid, task_ids=unscheduled)
+
+
+def reminder_member(user_uuid: str, task_id: int) -> str:
+    return f"{user_uuid}:{task_id}"
+
+
+def reminder_sent_key(member: str) -> str:
+    return f"{TASK_REMINDERS_SENT_PREFIX}{member}"
+
+
+def reminder_score(deadline: Union[date, str]) -> int:
+    if isinstance(deadline, str):
+        deadline = datetime.strptime(deadline, "%d/%m/%Y").date()
+    day_start = datetime.combine(deadline, day_time.min, tzinfo=timezone.utc)
+    return int(day_start.timestamp()) - REMINDER_LEAD_SECONDS
+
+
+async def schedule_reminders_r(
+    redis: Redis,
+    user_uuid: str,
+    deadlines: dict,
+    now: Optional[float] = None,
+) -> None:
+    if not deadlines:
+        return
+    now = time.time() if now is None else now
+    keys: list = [TASK_DEADLINES_KEY]
+    args: list = [int(now) - REMINDER_SENT_KEEP_SECONDS]
+    for task_id, deadline in deadlines.items():
+        member = reminder_member(user_uuid, task_id)
+        keys.append(reminder_sent_key(member))
+        args.extend((member, reminder_score(deadline)))
+
+    schedule_reminders = redis.register_script(SCHEDULE_REMINDERS_SCRIPT)
+    await schedule_reminders(keys=keys, args=args)
+
+
+async def unschedule_reminders_r(
+    redis: Redis,
+    user_uuid: str,
+    task_ids: List[int],
+) -> None:
+    if not task_ids:
+        return
+    members = [reminder_member(user_uuid, task_id) for task_id in task_ids]
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.zrem(TASK_DEADLINES_KEY, *members)
+        pipe.delete(*[reminder_sent_key(member) for member in members])
+        await pipe.execute()
+
+
+async def pop_due_reminders_r(
+    redis: Redis,
+    now: float,
+    batch_size: int,
+) -> int:
+    pop_due_reminders = redis.register_script(POP_DUE_REMINDERS_SCRIPT)
+    return await pop_due_reminders(
+        keys=[TASK_DEADLINES_KEY, TASK_REMINDERS_STREAM],
+        args=[
+            now, batch_size, REMINDERS_STREAM_MAXLEN,
+            TASK_REMINDERS_SENT_PREFIX, REMINDER_SENT_KEEP_SECONDS,
+        ],
+    )
+
+
+async def get_tasks_page_r(
+    redis: Redis,
+    user_uuid: str,
+    page_key: str,
+) -> Optional[bytes]:
+    return await redis.hget(f"{user_uuid}_tasks_pages", page_key)
+
+
+async def set_tasks_page_r(
+    redis: Redis,
+    user_uuid: str,
+    page_key: str,
+    page: bytes,
+    version: str,
+) -> None:
+    await set_versioned_field_r(
+        redis=redis,
+        user_uuid=user_uuid,
+        key=f"{user_uuid}_tasks_pages",
+        field=page_key,
+        value=page,
+        version=version,
+    )
+
+
+async def get_due_tasks_r(
+    redis: Redis,
+    user_uuid: str,
+    query_key: str,
+) -> Optional[bytes]:
+    return await redis.hget(f"{user_uuid}_due_tasks", query_key)
+
+
+async def set_due_tasks_r(
+    redis: Redis,
+    user_uuid: str,
+    query_key: str,
+    due_tasks: bytes,
+    version: str,
+) -> None:
+    await set_versioned_field_r(
+        redis=redis,
+        user_uuid=user_uuid,
+        key=f"{user_uuid}_due_tasks",
+        field=query_key,
+        value=due_tasks,
+        version=version,
+    )
+
+
+async def set_versioned_field_r(
+    redis: Redis,
+    user_uuid: str,
+    key: str,
+    field: str,
+    value: bytes,
+    version: str,
+) -> None:
+    async with redis.pipeline(transaction=True) as pipe:
+        try:
+            if not await watch_version_r(
+                pipe=pipe, key=f"{user_uuid}_tasks_version", version=version
+            ):
+                return
+            pipe.multi()
+            pipe.hset(key, field, value)
+            pipe.expire(key, jittered_ttl(TASKS_SOFT_TTL))
+            await pipe.execute()
+        except WatchError:
+            return
+
+
+# Entries are named after the tasks version, so one written after a bump
+# is never read back
+async def get_compressed_tasks_r(
+    redis: Redis,
+    user_uuid: str,
+    entry: str,
+) -> Optional[bytes]:
+    return await redis.hget(f"{user_uuid}_tasks_compressed", entry)
+
+
+async def set_compressed_tasks_r(
+    redis: Redis,
+    user_uuid: str,
+    entry: str,
+    body: bytes,
 ) -> None:
-    await redis.set(f"{user_uuid}_tasks", json.dumps(tasks_data), ex=100)
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.hset(f"{user_uuid}_tasks_compressed", entry, body)
+        pipe.expire(f"{user_uuid}_tasks_compressed", jittered_ttl(TASKS_HARD_TTL))
+        await pipe.execute()
 
 
 async def delete_tasks_r(
     redis: Redis, 
     user_uuid: str
 ) -> None:
-    await redis.delete(f"{user_uuid}_tasks")
-    await redis.delete(f"{user_uuid}_vital_tasks")
\ No newline at end of file
+    delete_tasks = redis.register_script(DELETE_TASKS_SCRIPT)
+    await delete_tasks(
+        keys=[
+            f"{user_uuid}_tasks",
+            f"{user_uuid}_vital_tasks",
+            f"{user_uuid}_tasks_pages",
+            f"{user_uuid}_tasks_version",
+            f"{user_uuid}_tasks_compressed",
+            f"{user_uuid}_due_tasks",
+        ],
+    )
\ No newline at end of file
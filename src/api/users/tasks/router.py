@@ -1,152 +1,352 @@
-from typing import Optional
+from datetime import date, timedelta
+from functools import partial
+from typing import Awaitable, Callable, Dict, Optional
 
 from fastapi import (APIRouter, BackgroundTasks, Depends, File, Header,
-                     HTTPException, Query, UploadFile)
+                     HTTPException, Query, Response, UploadFile)
+from fastapi.responses import StreamingResponse
+from asyncpg import PostgresError
 from redis.asyncio import Redis
 from sqlalchemy.exc import SQLAlchemyError
 
-from api.users.service import get_user_uuid
-from api.users.tasks.crud import (change_task_status, create_task_in_db,
-                                  delete_task_db, edit_task_data,
-                                  get_task_to_complete,
+from api.users.service import (etag_headers, etag_matches, current_user_uuid,
+                               not_modified, version_etag)
+from api.users.tasks.config import TASKS_IMPORT_MAX_ROWS
+from api.users.tasks.crud import (change_task_status, change_tasks_status,
+                                  complete_tasks_db, copy_tasks_to_db,
+                                  create_task_in_db,
+                                  create_tasks_in_db, delete_task_db,
+                                  delete_tasks_db, edit_task_data,
                                   replace_tasks_between_tables,
                                   search_tasks_by_name, select_all_tasks,
-                                  select_vital_tasks)
-from api.users.tasks.schemas import TaskCreate, TaskEdit
+                                  select_due_tasks, select_tasks_page,
+                                  select_vital_tasks,
+                                  stream_all_tasks)
+from api.users.tasks.schemas import (TaskCreate, TaskEdit, TaskIdsBatch,
+                                     TasksBatchCreate)
 
-from api.users.tasks.service import (exclude_unset, serialize_tasks, set_task_pic, delete_task_img)
+from api.users.tasks.service import (decode_cursor, encode_cursor, exclude_unset,
+                                     export_tasks_csv, export_tasks_ndjson,
+                                     format_deadline, ImportReport,
+                                     ImportTooLargeError, parse_import_rows,
+                                     serialize_task,
+                                     serialize_tasks, set_task_pic)
 from api.users.tasks.crud_redis import (
-    get_tasks_r, get_vital_tasks_r, set_tasks_r, set_vital_tasks_r,
-    delete_tasks_r, 
+    get_tasks_r, get_vital_tasks_r, get_tasks_page_r, set_tasks_page_r,
+    encode_json, get_tasks_version_r,
+    get_compressed_tasks_r, set_compressed_tasks_r, get_due_tasks_r,
+    set_due_tasks_r, task_field,
 )
-from db.engine import SessionDep
-from redis_utils.client import get_redis
+from compression.middleware import COMPRESSION_MINIMUM_SIZE, choose_encoding, compress
+from db.engine import ReadSessionDep, SessionDep
+from jobs.queue import enqueue_job_r
+from redis_utils.client import get_redis_bytes
 
 users_tasks_router = APIRouter(prefix="/users/tasks")
 
 
 @users_tasks_router.post("/create_task")
 async def create_task(
-    background_tasks: BackgroundTasks,
     session: SessionDep,
-    authorization: str = Header(None, alias="Authorization"),
+    user_uuid: str = Depends(current_user_uuid),
     task_data: TaskCreate = Depends(TaskCreate.get_tasks_fields),
     task_img: UploadFile | None = File(None),
-    redis_client: Redis = Depends(get_redis),
+    redis_client: Redis = Depends(get_redis_bytes),
 ):
-    user_uuid = await get_user_uuid(
-        auth_token=authorization
-    )
-    background_tasks.add_task(
-        delete_tasks_r, 
-        redis=redis_client, 
-        user_uuid=user_uuid)
     task_data = await exclude_unset(task_data=task_data)
 
-    task_id = await create_task_in_db(
+    task = await create_task_in_db(
         session=session, 
         user_uuid=user_uuid, 
         task_data=task_data
     )
-    if task_img:
-        if task_img.content_type not in ["image/jpeg", "image/png"]:
-            raise HTTPException(400, "Only JPG/PNG")
-        await set_task_pic(
-            task_img=task_img, 
-            task_id=task_id, 
-            user_uuid=user_uuid)
+    # The task is committed even if its picture is rejected, so the cache
+    # update must go out either way
+    try:
+        if task_img:
+            task = await set_task_pic(
+                session=session,
+                task_img=task_img, 
+                task_id=task.id, 
+                user_uuid=user_uuid)
+    finally:
+        await enqueue_job_r(
+            redis=redis_client,
+            name="update_tasks",
+            ordering_key=user_uuid,
+            user_uuid=user_uuid,
+            upserted=[await serialize_task(task=task, user_uuid=user_uuid)],
+        )
 
 
 @users_tasks_router.get("/get_all_tasks")
 async def get_all_tasks(
-    session: SessionDep,
+    session: ReadSessionDep,
     background_tasks: BackgroundTasks,
-    authorization: str = Header(None, alias="Authorization"),
-    redis_client: Redis = Depends(get_redis),
+    user_uuid: str = Depends(current_user_uuid),
+    redis_client: Redis = Depends(get_redis_bytes),
+    limit: Optional[int] = Query(None, ge=1, le=100),
+    after: Optional[str] = Query(None, description="Cursor from the previous page"),
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
+    accept_encoding: Optional[str] = Header(None, alias="Accept-Encoding"),
 ):
-    user_uuid = await get_user_uuid(
-        auth_token=authorization
+    version = await get_tasks_version_r(redis=redis_client, user_uuid=user_uuid)
+    etag = version_etag(version=version)
+    if etag_matches(if_none_match=if_none_match, etag=etag):
+        return not_modified(etag=etag)
+
+    if limit is not None:
+        return await tasks_response(
+            background_tasks=background_tasks,
+            redis_client=redis_client,
+            user_uuid=user_uuid,
+            entry=f"page:{limit}:{after or ''}:{version}",
+            etag=etag,
+            accept_encoding=accept_encoding,
+            load_body=partial(
+                get_tasks_page,
+                session=session,
+                background_tasks=background_tasks,
+                redis_client=redis_client,
+                user_uuid=user_uuid,
+                limit=limit,
+                after=after,
+                version=version,
+            ),
+        )
+
+    return await tasks_response(
+        background_tasks=background_tasks,
+        redis_client=redis_client,
+        user_uuid=user_uuid,
+        entry=f"all:{version}",
+        etag=etag,
+        accept_encoding=accept_encoding,
+        load_body=partial(
+            get_tasks_r,
+            redis=redis_client,
+            user_uuid=user_uuid,
+            loader=partial(load_all_tasks, session=session, user_uuid=user_uuid),
+            background_tasks=background_tasks,
+        ),
     )
-    tasks_from_cache = await get_tasks_r(
-        redis=redis_client, 
-        user_uuid=user_uuid
+
+
+async def tasks_response(
+    background_tasks: BackgroundTasks,
+    redis_client: Redis,
+    user_uuid: str,
+    entry: str,
+    etag: str,
+    accept_encoding: Optional[str],
+    load_body: Callable[[], Awaitable[bytes]],
+) -> Response:
+    headers = {**etag_headers(etag=etag), "Vary": "Accept-Encoding"}
+    encoding = choose_encoding(accept_encoding=accept_encoding)
+    if encoding is not None:
+        entry = f"{entry}:{encoding}"
+        compressed = await get_compressed_tasks_r(
+            redis=redis_client, user_uuid=user_uuid, entry=entry
+        )
+        if compressed is not None:
+            headers["Content-Encoding"] = encoding
+            return Response(
+                content=compressed, media_type="application/json", headers=headers
+            )
+
+    body = await load_body()
+    if encoding is None or len(body) < COMPRESSION_MINIMUM_SIZE:
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    compressed = compress(body=body, encoding=encoding)
+    background_tasks.add_task(
+        set_compressed_tasks_r,
+        redis=redis_client,
+        user_uuid=user_uuid,
+        entry=entry,
+        body=compressed,
     )
-    if tasks_from_cache:
-        return tasks_from_cache
+    headers["Content-Encoding"] = encoding
+    return Response(content=compressed, media_type="application/json", headers=headers)
+
 
+async def load_all_tasks(
+    session: ReadSessionDep,
+    user_uuid: str,
+) -> Dict[str, dict]:
     tasks_from_db = await select_all_tasks(
         session=session, 
         user_uuid=user_uuid
     )
-    tasks_data = await serialize_tasks(
+    serialized_tasks = await serialize_tasks(
         tasks=tasks_from_db, 
         user_uuid=user_uuid
     )
+    return {
+        task_field(task_id=task.id, completed=task.completed): serialized_task
+        for task, serialized_task in zip(tasks_from_db, serialized_tasks)
+    }
 
+
+async def get_tasks_page(
+    session: ReadSessionDep,
+    background_tasks: BackgroundTasks,
+    redis_client: Redis,
+    user_uuid: str,
+    limit: int,
+    after: Optional[str],
+    version: str,
+) -> bytes:
+    page_key = f"{limit}:{after or ''}"
+    page_from_cache = await get_tasks_page_r(
+        redis=redis_client,
+        user_uuid=user_uuid,
+        page_key=page_key,
+    )
+    if page_from_cache:
+        return page_from_cache
+
+    try:
+        cursor = await decode_cursor(cursor=after)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    tasks_from_db = await select_tasks_page(
+        session=session,
+        user_uuid=user_uuid,
+        limit=limit + 1,
+        after=cursor,
+    )
+    has_more = len(tasks_from_db) > limit
+    tasks_from_db = tasks_from_db[:limit]
+
+    page = encode_json({
+        "tasks": await serialize_tasks(tasks=tasks_from_db, user_uuid=user_uuid),
+        "next_cursor": (
+            await encode_cursor(task=tasks_from_db[-1]) if has_more else None
+        ),
+    })
     background_tasks.add_task(
-        set_tasks_r, 
-        redis=redis_client, 
-        user_uuid=user_uuid, 
-        tasks_data=tasks_data
+        set_tasks_page_r,
+        redis=redis_client,
+        user_uuid=user_uuid,
+        page_key=page_key,
+        page=page,
+        version=version,
     )
-    return tasks_data
+    return page
 
 
 @users_tasks_router.get("/get_vital_tasks")
 async def get_vital_tasks(
     background_tasks: BackgroundTasks,
-    session: SessionDep,
-    authorization: str = Header(None, alias="Authorization"),
-    redis_client: Redis = Depends(get_redis),
+    session: ReadSessionDep,
+    user_uuid: str = Depends(current_user_uuid),
+    redis_client: Redis = Depends(get_redis_bytes),
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
+    accept_encoding: Optional[str] = Header(None, alias="Accept-Encoding"),
 ):
-    user_uuid = await get_user_uuid(
-        auth_token=authorization
-    )
-    vital_tasks = await get_vital_tasks_r(
-        redis=redis_client, 
-        user_uuid=user_uuid
+    version = await get_tasks_version_r(redis=redis_client, user_uuid=user_uuid)
+    etag = version_etag(version=version)
+    if etag_matches(if_none_match=if_none_match, etag=etag):
+        return not_modified(etag=etag)
+
+    return await tasks_response(
+        background_tasks=background_tasks,
+        redis_client=redis_client,
+        user_uuid=user_uuid,
+        entry=f"vital:{version}",
+        etag=etag,
+        accept_encoding=accept_encoding,
+        load_body=partial(
+            get_vital_tasks_r,
+            redis=redis_client,
+            user_uuid=user_uuid,
+            loader=partial(load_vital_tasks, session=session, user_uuid=user_uuid),
+            background_tasks=background_tasks,
+        ),
     )
-    if vital_tasks:
-        return vital_tasks
 
+
+async def load_vital_tasks(
+    session: ReadSessionDep,
+    user_uuid: str,
+) -> Dict[str, dict]:
     db_vital_tasks = await select_vital_tasks(
         session=session, 
         user_uuid=user_uuid
     )
-    vital_tasks_data = await serialize_tasks(
+    serialized_tasks = await serialize_tasks(
         tasks=db_vital_tasks, 
         user_uuid=user_uuid
     )
-    background_tasks.add_task(
-        set_vital_tasks_r,
-        redis=redis_client,
-        user_uuid=user_uuid,
-        vital_tasks=vital_tasks_data,
+    return {task_field(task_id=task["id"]): task for task in serialized_tasks}
+
+
+@users_tasks_router.get("/due_tasks")
+async def get_due_tasks(
+    background_tasks: BackgroundTasks,
+    session: ReadSessionDep,
+    days: int = Query(7, ge=0, le=365),
+    include_overdue: bool = Query(True),
+    limit: int = Query(50, ge=1, le=200),
+    user_uuid: str = Depends(current_user_uuid),
+    redis_client: Redis = Depends(get_redis_bytes),
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
+):
+    today = date.today()
+    version = await get_tasks_version_r(redis=redis_client, user_uuid=user_uuid)
+    etag = version_etag(version=f"{version}-{today.isoformat()}")
+    if etag_matches(if_none_match=if_none_match, etag=etag):
+        return not_modified(etag=etag)
+
+    query_key = f"{today.isoformat()}:{days}:{int(include_overdue)}:{limit}"
+    due_tasks = await get_due_tasks_r(
+        redis=redis_client, user_uuid=user_uuid, query_key=query_key
+    )
+    if due_tasks is None:
+        tasks_from_db = await select_due_tasks(
+            session=session,
+            user_uuid=user_uuid,
+            due_before=today + timedelta(days=days),
+            due_after=None if include_overdue else today,
+            limit=limit,
+        )
+        due_tasks = encode_json(
+            await serialize_tasks(tasks=tasks_from_db, user_uuid=user_uuid)
+        )
+        background_tasks.add_task(
+            set_due_tasks_r,
+            redis=redis_client,
+            user_uuid=user_uuid,
+            query_key=query_key,
+            due_tasks=due_tasks,
+            version=version,
+        )
+    return Response(
+        content=due_tasks, media_type="application/json", headers=etag_headers(etag=etag)
     )
-    return vital_tasks_data
 
 
 @users_tasks_router.patch("/start_task/{task_id}")
 async def start_task(
-    background_task: BackgroundTasks,
     session: SessionDep,
     task_id: int,
-    authorization: str = Header(None, alias="Authorization"),
-    redis_client: Redis = Depends(get_redis),
+    user_uuid: str = Depends(current_user_uuid),
+    redis_client: Redis = Depends(get_redis_bytes),
 ):
-    user_uuid = await get_user_uuid(
-        auth_token=authorization
-    )
     try:
-        await change_task_status(
+        task = await change_task_status(
             session=session, 
             user_uuid=user_uuid, 
             task_id=task_id
         )
-        background_task.add_task(
-            delete_tasks_r, 
-            redis=redis_client, 
-            user_uuid=user_uuid
+        await enqueue_job_r(
+            redis=redis_client,
+            name="update_tasks",
+            ordering_key=user_uuid,
+            user_uuid=user_uuid,
+            upserted=[await serialize_task(task=task, user_uuid=user_uuid)],
         )
     except ValueError:
         raise HTTPException(status_code=404, detail="No such task")
@@ -154,32 +354,39 @@ async def start_task(
 
 @users_tasks_router.patch("/edit_task/{task_id}")
 async def edit_task(
-    background_task: BackgroundTasks,
     session: SessionDep,
     task_id: int,
     task_data: TaskEdit = Depends(TaskEdit.get_optional_tasks_fields),
     task_img: UploadFile | None = File(None),
-    authorization: str = Header(None, alias="Authorization"),
-    redis_client: Redis = Depends(get_redis),
+    user_uuid: str = Depends(current_user_uuid),
+    redis_client: Redis = Depends(get_redis_bytes),
 ):
-    user_uuid = await get_user_uuid(
-        auth_token=authorization
-    )
     list_of_changes = await exclude_unset(task_data=task_data)
     try:
-        await edit_task_data(
+        task = await edit_task_data(
             session=session,
             user_uuid=user_uuid,
             task_id=task_id,
             task_data=list_of_changes,
         )
-        if task_img:
-            if task_img.content_type not in ["image/jpeg", "image/png"]:
-                raise HTTPException(400, "Only JPG/PNG")
-            await set_task_pic(task_img=task_img, task_id=task_id, user_uuid=user_uuid)
-        background_task.add_task(
-            delete_tasks_r, redis=redis_client, user_uuid=user_uuid
-        )
+        try:
+            if task_img:
+                task = await set_task_pic(
+                    session=session,
+                    task_img=task_img,
+                    task_id=task_id,
+                    user_uuid=user_uuid,
+                )
+        finally:
+            await enqueue_job_r(
+                redis=redis_client,
+                name="update_tasks",
+                ordering_key=user_uuid,
+                user_uuid=user_uuid,
+                upserted=[await serialize_task(task=task, user_uuid=user_uuid)],
+            )
+    except HTTPException:
+        raise
     except ValueError:
         raise HTTPException(status_code=404, detail="No such task")
     except SQLAlchemyError:
@@ -190,38 +397,35 @@ async def edit_task(
 
 @users_tasks_router.patch("/complete_task/{task_id}")
 async def complete_task(
-    background_tasks: BackgroundTasks,
     session: SessionDep,
     task_id: int,
-    authorization: str = Header(None, alias="Authorization"),
-    redis_client: Redis = Depends(get_redis),
+    user_uuid: str = Depends(current_user_uuid),
+    redis_client: Redis = Depends(get_redis_bytes),
 ):
-    user_uuid = await get_user_uuid(auth_token=authorization)
     try:
-        task = await get_task_to_complete(
+        task, evicted_ids, old_blobs = await replace_tasks_between_tables(
             session=session, 
             user_uuid=user_uuid, 
             task_id=task_id
         )
 
-        img_to_delete, task_id_to_delete = await replace_tasks_between_tables(
-            session=session, 
-            task=task, 
-            user_uuid=user_uuid, 
-            task_id=task_id
-        )
-        
-        if img_to_delete and task_id_to_delete:
-            background_tasks.add_task(
-                delete_task_img,
-                task_id=task_id_to_delete,
-                user_uuid=user_uuid
+        if evicted_ids:
+            await enqueue_job_r(
+                redis=redis_client,
+                name="delete_task_imgs",
+                user_uuid=user_uuid,
+                task_ids=evicted_ids,
+                old_blobs=old_blobs,
             )
 
-        background_tasks.add_task(
-            delete_tasks_r, 
-            redis=redis_client, 
-            user_uuid=user_uuid
+        await enqueue_job_r(
+            redis=redis_client,
+            name="update_tasks",
+            ordering_key=user_uuid,
+            user_uuid=user_uuid,
+            upserted=[await serialize_task(task=task, user_uuid=user_uuid)],
+            removed_ids=evicted_ids,
+            completed=True,
         )
     except ValueError:
         raise HTTPException(status_code=404, detail="Task not found")
@@ -231,20 +435,19 @@ async def complete_task(
 
 @users_tasks_router.get("/search")
 async def search_tasks(
-    session: SessionDep,
+    session: ReadSessionDep,
     task_name: Optional[str] = Query(None, description="Текст поиска"),
-    authorization: str = Header(None, alias="Authorization"),
+    limit: int = Query(20, ge=1, le=100),
+    user_uuid: str = Depends(current_user_uuid),
 ):
     if not task_name:
         return {}
-    user_uuid = await get_user_uuid(
-        auth_token=authorization
-    )
     try:
         found_tasks = await search_tasks_by_name(
             session=session, 
             user_uuid=user_uuid, 
-            task_name=task_name
+            task_name=task_name,
+            limit=limit,
         )
         if found_tasks is None:
             return {}
@@ -261,31 +464,255 @@ async def search_tasks(
 
 @users_tasks_router.delete("/delete_task/{task_id}")
 async def delete_task(
-    background_task: BackgroundTasks,
     task_id: int,
     session: SessionDep,
-    authorization: str = Header(None, alias="Authorization"),
-    redis_client: Redis = Depends(get_redis),
+    user_uuid: str = Depends(current_user_uuid),
+    redis_client: Redis = Depends(get_redis_bytes),
 ):
-    user_uuid = await get_user_uuid(
-        auth_token=authorization
-    )
     try:
-        await delete_task_db(
+        old_blobs = await delete_task_db(
             session=session, 
             task_id=task_id, 
             user_uuid=user_uuid
         )
 
-        background_task.add_task(
-            delete_tasks_r, 
-            redis=redis_client, 
-            user_uuid=user_uuid
+        await enqueue_job_r(
+            redis=redis_client,
+            name="update_tasks",
+            ordering_key=user_uuid,
+            user_uuid=user_uuid,
+            removed_ids=[task_id],
         )
-        background_task.add_task(
-            delete_task_img,
-            task_id=task_id,
-            user_uuid=user_uuid
+        await enqueue_job_r(
+            redis=redis_client,
+            name="delete_task_imgs",
+            user_uuid=user_uuid,
+            task_ids=[task_id],
+            old_blobs=old_blobs,
         )
     except ValueError:
         raise HTTPException(status_code=404, detail="Task Error")
+
+
+@users_tasks_router.post("/batch/create_tasks")
+async def create_tasks(
+    session: SessionDep,
+    batch: TasksBatchCreate,
+    user_uuid: str = Depends(current_user_uuid),
+    redis_client: Redis = Depends(get_redis_bytes),
+):
+    try:
+        tasks = await create_tasks_in_db(
+            session=session,
+            user_uuid=user_uuid,
+            tasks_data=[await exclude_unset(task_data=task) for task in batch.tasks],
+        )
+    except SQLAlchemyError:
+        raise HTTPException(status_code=500, detail="DataBase Error")
+
+    await enqueue_job_r(
+        redis=redis_client,
+        name="update_tasks",
+        ordering_key=user_uuid,
+        user_uuid=user_uuid,
+        upserted=await serialize_tasks(tasks=tasks, user_uuid=user_uuid),
+    )
+    return {
+        "results": [
+            {"index": index, "id": task.id, "status": "created"}
+            for index, task in enumerate(tasks)
+        ]
+    }
+
+
+@users_tasks_router.patch("/batch/start_tasks")
+async def start_tasks(
+    session: SessionDep,
+    batch: TaskIdsBatch,
+    user_uuid: str = Depends(current_user_uuid),
+    redis_client: Redis = Depends(get_redis_bytes),
+):
+    try:
+        tasks = await change_tasks_status(
+            session=session,
+            user_uuid=user_uuid,
+            task_ids=batch.task_ids,
+        )
+    except SQLAlchemyError:
+        raise HTTPException(status_code=500, detail="DataBase Error")
+
+    if tasks:
+        await enqueue_job_r(
+            redis=redis_client,
+            name="update_tasks",
+            ordering_key=user_uuid,
+            user_uuid=user_uuid,
+            upserted=await serialize_tasks(tasks=tasks, user_uuid=user_uuid),
+        )
+    updated_ids = {task.id for task in tasks}
+    return {
+        "results": [
+            {"id": task_id, "status": "updated" if task_id in updated_ids else "not_found"}
+            for task_id in batch.task_ids
+        ]
+    }
+
+
+@users_tasks_router.patch("/batch/complete_tasks")
+async def complete_tasks(
+    session: SessionDep,
+    batch: TaskIdsBatch,
+    user_uuid: str = Depends(current_user_uuid),
+    redis_client: Redis = Depends(get_redis_bytes),
+):
+    try:
+        tasks, evicted_ids, dropped_ids, old_blobs = await complete_tasks_db(
+            session=session,
+            user_uuid=user_uuid,
+            task_ids=batch.task_ids,
+        )
+    except SQLAlchemyError:
+        raise HTTPException(status_code=500, detail="DataBase Error")
+
+    evicted_ids = evicted_ids + dropped_ids
+    if evicted_ids:
+        await enqueue_job_r(
+            redis=redis_client,
+            name="delete_task_imgs",
+            user_uuid=user_uuid,
+            task_ids=evicted_ids,
+            old_blobs=old_blobs,
+        )
+    if tasks or evicted_ids:
+        await enqueue_job_r(
+            redis=redis_client,
+            name="update_tasks",
+            ordering_key=user_uuid,
+            user_uuid=user_uuid,
+            upserted=await serialize_tasks(tasks=tasks, user_uuid=user_uuid),
+            removed_ids=evicted_ids,
+            completed=True,
+        )
+    # Dropped tasks were completed but did not fit in the completed history
+    outcomes = {
+        **{task_id: "dropped" for task_id in dropped_ids},
+        **{task.id: "completed" for task in tasks},
+    }
+    return {
+        "results": [
+            {"id": task_id, "status": outcomes.get(task_id, "not_found")}
+            for task_id in batch.task_ids
+        ]
+    }
+
+
+@users_tasks_router.delete("/batch/delete_tasks")
+async def delete_tasks(
+    session: SessionDep,
+    batch: TaskIdsBatch,
+    user_uuid: str = Depends(current_user_uuid),
+    redis_client: Redis = Depends(get_redis_bytes),
+):
+    try:
+        deleted_ids, old_blobs = await delete_tasks_db(
+            session=session,
+            user_uuid=user_uuid,
+            task_ids=batch.task_ids,
+        )
+    except SQLAlchemyError:
+        raise HTTPException(status_code=500, detail="DataBase Error")
+
+    if deleted_ids:
+        await enqueue_job_r(
+            redis=redis_client,
+            name="update_tasks",
+            ordering_key=user_uuid,
+            user_uuid=user_uuid,
+            removed_ids=deleted_ids,
+        )
+        await enqueue_job_r(
+            redis=redis_client,
+            name="delete_task_imgs",
+            user_uuid=user_uuid,
+            task_ids=deleted_ids,
+            old_blobs=old_blobs,
+        )
+    deleted = set(deleted_ids)
+    return {
+        "results": [
+            {"id": task_id, "status": "deleted" if task_id in deleted else "not_found"}
+            for task_id in batch.task_ids
+        ]
+    }
+
+
+EXPORT_FORMATS = {
+    "ndjson": (export_tasks_ndjson, "application/x-ndjson"),
+    "csv": (export_tasks_csv, "text/csv; charset=utf-8"),
+}
+
+
+@users_tasks_router.get("/export")
+async def export_tasks(
+    session: ReadSessionDep,
+    export_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+    user_uuid: str = Depends(current_user_uuid),
+):
+    encoder, media_type = EXPORT_FORMATS[export_format]
+
+    return StreamingResponse(
+        encoder(stream_all_tasks(session=session, user_uuid=user_uuid)),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="tasks.{export_format}"'
+        },
+    )
+
+
+@users_tasks_router.post("/import")
+async def import_tasks(
+    session: SessionDep,
+    task_file: UploadFile = File(...),
+    import_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+    user_uuid: str = Depends(current_user_uuid),
+    redis_client: Redis = Depends(get_redis_bytes),
+):
+    report = ImportReport()
+    try:
+        imported, open_tasks = await copy_tasks_to_db(
+            session=session,
+            user_uuid=user_uuid,
+            records=parse_import_rows(
+                task_file=task_file.file,
+                import_format=import_format,
+                user_uuid=user_uuid,
+                report=report,
+            ),
+        )
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="File must be UTF-8 encoded")
+    except ImportTooLargeError:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {TASKS_IMPORT_MAX_ROWS} rows can be imported at once",
+        )
+    except (SQLAlchemyError, PostgresError):
+        raise HTTPException(status_code=500, detail="DataBase Error")
+
+    if imported:
+        await enqueue_job_r(
+            redis=redis_client,
+            name="delete_tasks",
+            ordering_key=user_uuid,
+            user_uuid=user_uuid,
+        )
+        await enqueue_job_r(
+            redis=redis_client,
+            name="schedule_reminders",
+            ordering_key=user_uuid,
+            user_uuid=user_uuid,
+            deadlines={
+                task.id: format_deadline(task.deadline) for task in open_tasks
+            },
+        )
+    return {"imported": imported, "rejected": report.rejected, "errors": report.errors}
@@ -1,7 +1,13 @@
-from typing import Optional
+from datetime import date, datetime
+from typing import List, Optional
 
 from fastapi import Form
-from pydantic import BaseModel, ConfigDict
+from fastapi.exceptions import RequestValidationError
+from pydantic import (BaseModel, ConfigDict, Field, ValidationError,
+                      field_validator)
+
+from api.users.tasks.config import TASKS_BATCH_LIMIT
+from db.models import TaskPriority, TaskStatus
 
 
 class TaskBase(BaseModel):
@@ -9,12 +15,37 @@ class TaskBase(BaseModel):
     description: Optional[str]
     status: Optional[str]
     priority: Optional[str]
-    deadline: Optional[str]
+    deadline: Optional[date]
 
     model_config = ConfigDict(extra="forbid")
 
+    @field_validator("deadline", mode="before")
+    @classmethod
+    def parse_deadline(cls, deadline):
+        if isinstance(deadline, str):
+            return datetime.strptime(deadline, "%d/%m/%Y").date()
+        return deadline
+
 
 class TaskCreate(TaskBase):
+    title: str = Field(min_length=1, max_length=100)
+    description: str = Field(min_length=1, max_length=500)
+    status: Optional[str] = None
+    priority: str
+    deadline: date
+
+    @field_validator("status")
+    @classmethod
+    def check_status(cls, status: Optional[str]) -> Optional[str]:
+        if status is not None:
+            TaskStatus(status)
+        return status
+
+    @field_validator("priority")
+    @classmethod
+    def check_priority(cls, priority: str) -> str:
+        TaskPriority(priority)
+        return priority
 
     @classmethod
     def get_tasks_fields(
@@ -25,13 +56,16 @@ class TaskCreate(TaskBase):
         priority: str = Form(...),
         deadline: str = Form(...),
     ):
-        return cls(
-            title=title,
-            description=description,
-            status=status,
-            priority=priority,
-            deadline=deadline,
-        )
+        try:
+            return cls(
+                title=title,
+                description=description,
+                status=status,
+                priority=priority,
+                deadline=deadline,
+            )
+        except ValidationError as err:
+            raise RequestValidationError(err.errors())
 
 
 class TaskEdit(TaskBase):
@@ -44,10 +78,25 @@ class TaskEdit(TaskBase):
         priority: Optional[str] = Form(None),
         deadline: Optional[str] = Form(None),
     ):
-        return cls(
-            title=title,
-            description=description,
-            status=status,
-            priority=priority,
-            deadline=deadline,
-        )
+        try:
+            return cls(
+                title=title,
+                description=description,
+                status=status,
+                priority=priority,
+                deadline=deadline,
+            )
+        except ValidationError as err:
+            raise RequestValidationError(err.errors())
+
+
+class TasksBatchCreate(BaseModel):
+    tasks: List[TaskCreate] = Field(min_length=1, max_length=TASKS_BATCH_LIMIT)
+
+    model_config = ConfigDict(extra="forbid")
+
+
+class TaskIdsBatch(BaseModel):
+    task_ids: List[int] = Field(min_length=1, max_length=TASKS_BATCH_LIMIT)
+
+    model_config = ConfigDict(extra="forbid")
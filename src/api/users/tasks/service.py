@@ -1,23 +1,62 @@
-from typing import List
+import base64
+import csv
+import io
+import json
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from functools import lru_cache, partial
+from pathlib import Path
+from typing import Any, AsyncIterator, BinaryIO, Iterator, List, Optional
+from uuid import UUID
 
 import aiofiles
 import aiofiles.os
 from fastapi import HTTPException
+from pydantic import ValidationError
 
-from api.users.tasks.config import TASK_IMG_URL, TASK_UPLOAD_DIR
-from db.models import TasksTable
+from api.users.tasks.config import (TASK_IMG_URL, TASK_UPLOAD_DIR,
+                                    TASKS_IMPORT_MAX_ERRORS, TASKS_IMPORT_MAX_ROWS)
+from api.users.tasks.crud import set_task_img_blob
+from api.users.tasks.schemas import TaskCreate
+from db.engine import SessionDep
+from db.models import TaskStatus
+from images.store import blob_url, store_blob
+from images.upload import ImageTooLargeError, ImageTypeError
+from images.variants import variant_names, variant_paths
+
+
+def task_img_path(user_uuid: str, task_id: int) -> Path:
+    return TASK_UPLOAD_DIR / f"{task_id}_{user_uuid}.jpeg"
+
+
+async def remove_task_img_files(user_uuid: str, task_id: int) -> None:
+    filepath = task_img_path(user_uuid=user_uuid, task_id=task_id)
+    await aiofiles.os.remove(filepath)
+    for variant_path in variant_paths(filepath):
+        try:
+            await aiofiles.os.remove(variant_path)
+        except FileNotFoundError:
+            continue
 
 
 async def set_task_pic(
+    session: SessionDep,
     task_img, 
     task_id: int, 
     user_uuid: str
-) -> None:
-    filepath = TASK_UPLOAD_DIR / f"{task_id}_{user_uuid}.jpeg"
+) -> Any:
     try:
-        async with aiofiles.open(filepath, mode="wb") as f:
-            content = await task_img.read()
-            await f.write(content)
+        return await store_blob(
+            session=session,
+            upload=task_img,
+            set_reference=partial(
+                set_task_img_blob, session=session, user_uuid=user_uuid, task_id=task_id
+            ),
+        )
+    except ImageTypeError:
+        raise HTTPException(status_code=400, detail="Only JPG/PNG")
+    except ImageTooLargeError:
+        raise HTTPException(status_code=413, detail="Picture is too large")
     except Exception as e:
         raise HTTPException(
             status_code=400, detail=str(f"{e}, picture installing error")
@@ -27,10 +66,10 @@ async def delete_task_img(
     user_uuid: str,
     task_id: int
 ) -> None:
-    filepath = TASK_UPLOAD_DIR / f"{task_id}_{user_uuid}.jpeg"
+    filepath = task_img_path(user_uuid=user_uuid, task_id=task_id)
     try:
         if await aiofiles.os.path.exists(filepath):
-            await aiofiles.os.remove(filepath)
+            await remove_task_img_files(user_uuid=user_uuid, task_id=task_id)
         else:
             raise HTTPException(status_code=404, detail="Picture not found")
     except Exception as e:
@@ -39,39 +78,195 @@ async def delete_task_img(
         )
 
 
+async def delete_task_imgs(
+    user_uuid: str,
+    task_ids: List[int]
+) -> None:
+    for task_id in task_ids:
+        try:
+            await remove_task_img_files(user_uuid=user_uuid, task_id=task_id)
+        except FileNotFoundError:
+            continue
+
+
+# Deadlines repeat a lot across rows, so each distinct date is formatted once
+@lru_cache(maxsize=4096)
+def format_deadline(deadline) -> str:
+    if isinstance(deadline, date):
+        return f"{deadline.day:02d}/{deadline.month:02d}/{deadline.year:04d}"
+    return deadline
+
+
 async def serialize_tasks(
-    tasks: List[TasksTable], 
+    tasks: List[Any], 
     user_uuid: str
 ) -> List[dict]:
-    serialized_tasks = [
-        {
-            "id": task.id,
-            "title": task.title,
-            "description": task.description,
-            "status": task.status.value,
-            "priority": task.priority.value,
-            "deadline": task.deadline,
-            "task_img": TASK_IMG_URL + f"{task.id}_{user_uuid}.jpeg",
-        }
-        for task in tasks
-    ]
+    img_suffix = f"_{user_uuid}.jpeg"
+    serialized_tasks = []
+    for task_id, title, description, status, priority, deadline, img_blob, *_ in tasks:
+        # Images uploaded before blob storage keep their per-task file names
+        # and were never resized
+        if img_blob:
+            task_img = blob_url(img_blob)
+            task_img_variants = variant_names(task_img)
+        else:
+            task_img = f"{TASK_IMG_URL}{task_id}{img_suffix}"
+            task_img_variants = None
+        serialized_tasks.append({
+            "id": task_id,
+            "title": title,
+            "description": description,
+            "status": status.value,
+            "priority": priority.value,
+            "deadline": format_deadline(deadline),
+            "task_img": task_img,
+            "task_img_variants": task_img_variants,
+        })
     return serialized_tasks
 
 
-async def exclude_unset(task_data) -> dict:
-    return {key: value for key, value in dict(task_data).items() if value is not None}
+async def serialize_task(
+    task: Any,
+    user_uuid: str
+) -> dict:
+    serialized_task = await serialize_tasks(tasks=[task], user_uuid=user_uuid)
+    return serialized_task[0]
 
 
-async def serialize_TaskTable_obj_data(
-    task_obj: TasksTable
-) -> dict:
-    return {
-        "id": task_obj.id,
-        "user_id": task_obj.user_id,
-        "title": task_obj.title,
-        "description": task_obj.description,
-        "priority": str(task_obj.priority.value),
-        "deadline": task_obj.deadline,
-        "created_at": task_obj.created_at,
-        "updated_at": task_obj.updated_at,
-    }
+EXPORT_FIELDS = (
+    "id", "title", "description", "status", "priority", "deadline", "created_at"
+)
+
+
+def export_row(task: Any) -> tuple:
+    task_id, title, description, status, priority, deadline, _, created_at = task
+    return (
+        task_id,
+        title,
+        description,
+        status.value,
+        priority.value,
+        format_deadline(deadline),
+        created_at.isoformat(),
+    )
+
+
+async def export_tasks_ndjson(chunks: AsyncIterator[List[Any]]) -> AsyncIterator[bytes]:
+    async for rows in chunks:
+        yield "".join(
+            json.dumps(dict(zip(EXPORT_FIELDS, export_row(row))), ensure_ascii=False)
+            + "\n"
+            for row in rows
+        ).encode()
+
+
+async def export_tasks_csv(chunks: AsyncIterator[List[Any]]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    async for rows in chunks:
+        writer.writerows(export_row(row) for row in rows)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def read_import_rows(
+    task_file: BinaryIO,
+    import_format: str
+) -> Iterator[tuple[int, Any]]:
+    text = io.TextIOWrapper(task_file, encoding="utf-8-sig", newline="")
+    try:
+        if import_format == "csv":
+            reader = csv.DictReader(text)
+            for row in reader:
+                yield reader.line_num, {
+                    key: value or None for key, value in row.items() if key
+                }
+        else:
+            for line_no, line in enumerate(text, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield line_no, json.loads(line)
+                except ValueError:
+                    yield line_no, None
+    finally:
+        text.detach()
+
+
+class ImportTooLargeError(Exception):
+    pass
+
+
+# Only the first max_errors rejected rows are reported, the rest are counted
+@dataclass
+class ImportReport:
+    max_errors: int = TASKS_IMPORT_MAX_ERRORS
+    rejected: int = 0
+    errors: List[dict] = field(default_factory=list)
+
+    def reject(self, line_no: int, messages: List[str]) -> None:
+        self.rejected += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"row": line_no, "errors": messages})
+
+
+# A plain generator that reads the spooled upload, so the caller should pull
+# it from a worker thread
+def parse_import_rows(
+    task_file: BinaryIO,
+    import_format: str,
+    user_uuid: str,
+    report: ImportReport,
+    max_rows: int = TASKS_IMPORT_MAX_ROWS,
+) -> Iterator[tuple]:
+    user_id = UUID(user_uuid)
+    for row_count, (line_no, row) in enumerate(
+        read_import_rows(task_file, import_format), start=1
+    ):
+        if row_count > max_rows:
+            raise ImportTooLargeError()
+        if not isinstance(row, dict):
+            report.reject(line_no, ["Malformed row"])
+            continue
+        try:
+            task = TaskCreate(
+                **{key: row[key] for key in TaskCreate.model_fields if key in row}
+            )
+        except ValidationError as err:
+            report.reject(line_no, [
+                f"{'.'.join(map(str, error['loc']))}: {error['msg']}"
+                for error in err.errors()
+            ])
+            continue
+
+        yield (
+            user_id,
+            task.title,
+            task.description,
+            task.status or TaskStatus.NOT_STARTED.value,
+            task.priority,
+            task.deadline,
+        )
+
+
+async def encode_cursor(task: Any) -> str:
+    raw = json.dumps([task.created_at.isoformat(), task.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+async def decode_cursor(cursor: Optional[str]) -> Optional[tuple[datetime, int]]:
+    if not cursor:
+        return None
+    try:
+        created_at, task_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), int(task_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+async def exclude_unset(task_data) -> dict:
+    return {key: value for key, value in dict(task_data).items() if value is not None}
@@ -0,0 +1,79 @@
+import gzip
+from typing import Optional
+
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware, IdentityResponder
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSION_MINIMUM_SIZE = 1000
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Cached payloads are compressed once per version, so they can afford more
+PRECOMPRESS_GZIP_LEVEL = 9
+PRECOMPRESS_BROTLI_QUALITY = 9
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    accept_encoding = accept_encoding or ""
+    if brotli is not None and "br" in accept_encoding:
+        return "br"
+    if "gzip" in accept_encoding:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=PRECOMPRESS_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=PRECOMPRESS_GZIP_LEVEL, mtime=0)
+
+
+class BrotliResponder(IdentityResponder):
+    content_encoding = "br"
+
+    def __init__(self, app: ASGIApp, minimum_size: int, quality: int) -> None:
+        super().__init__(app, minimum_size)
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        compressed = self.compressor.process(body)
+        if more_body:
+            return compressed + self.compressor.flush()
+        return compressed + self.compressor.finish()
+
+
+class CompressionMiddleware(GZipMiddleware):
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = COMPRESSION_MINIMUM_SIZE,
+        compresslevel: int = GZIP_LEVEL,
+        brotli_quality: int = BROTLI_QUALITY,
+        excluded_paths: tuple = (),
+    ) -> None:
+        super().__init__(app, minimum_size=minimum_size, compresslevel=compresslevel)
+        self.brotli_quality = brotli_quality
+        self.excluded_paths = excluded_paths
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        # Images are already compressed, and encoding a 206 would break Range
+        if scope["type"] == "http" and scope["path"].startswith(self.excluded_paths):
+            await self.app(scope, receive, send)
+            return
+
+        if scope["type"] == "http":
+            accept_encoding = Headers(scope=scope).get("Accept-Encoding")
+            if choose_encoding(accept_encoding) == "br":
+                responder = BrotliResponder(
+                    self.app, self.minimum_size, quality=self.brotli_quality
+                )
+                await responder(scope, receive, send)
+                return
+
+        await super().__call__(scope, receive, send)
@@ -0,0 +1,55 @@
+"""Keyset pagination indexes
+
+Revision ID: 3f9c2a7d41e6
+Revises: 8ce4e4033b69
+Create Date: 2026-02-02 18:41:09.312604
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "3f9c2a7d41e6"
+down_revision: Union[str, Sequence[str], None] = "8ce4e4033b69"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_tasks_user_id_created_at_id",
+            "tasks",
+            ["user_id", "created_at", "id"],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            "ix_completed_tasks_user_id_created_at_id",
+            "completed_tasks",
+            ["user_id", "created_at", "id"],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_completed_tasks_user_id_created_at_id",
+            table_name="completed_tasks",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+        op.drop_index(
+            "ix_tasks_user_id_created_at_id",
+            table_name="tasks",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
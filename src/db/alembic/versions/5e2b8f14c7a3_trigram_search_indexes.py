@@ -0,0 +1,53 @@
+"""Trigram search indexes
+
+Revision ID: 5e2b8f14c7a3
+Revises: c41d7e0b9a52
+Create Date: 2026-02-06 20:13:45.027318
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "5e2b8f14c7a3"
+down_revision: Union[str, Sequence[str], None] = "c41d7e0b9a52"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TRIGRAM_INDEXES = [
+    ("ix_tasks_title_trgm", "tasks", "title"),
+    ("ix_tasks_description_trgm", "tasks", "description"),
+    ("ix_completed_tasks_title_trgm", "completed_tasks", "title"),
+    ("ix_completed_tasks_description_trgm", "completed_tasks", "description"),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    with op.get_context().autocommit_block():
+        for index_name, table_name, column in TRIGRAM_INDEXES:
+            op.create_index(
+                index_name,
+                table_name,
+                [column],
+                unique=False,
+                postgresql_using="gin",
+                postgresql_ops={column: "gin_trgm_ops"},
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for index_name, table_name, _ in reversed(TRIGRAM_INDEXES):
+            op.drop_index(
+                index_name,
+                table_name=table_name,
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
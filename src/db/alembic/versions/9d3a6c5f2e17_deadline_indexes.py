@@ -0,0 +1,52 @@
+"""Deadline indexes
+
+Revision ID: 9d3a6c5f2e17
+Revises: 5e2b8f14c7a3
+Create Date: 2026-02-11 15:42:08.319504
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "9d3a6c5f2e17"
+down_revision: Union[str, Sequence[str], None] = "5e2b8f14c7a3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_tasks_user_id_deadline",
+            "tasks",
+            ["user_id", "deadline"],
+            unique=False,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            "ix_tasks_user_id_deadline_open",
+            "tasks",
+            ["user_id", "deadline", "id"],
+            unique=False,
+            postgresql_where=sa.text("status <> 'DONE'"),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for index_name in ("ix_tasks_user_id_deadline_open", "ix_tasks_user_id_deadline"):
+            op.drop_index(
+                index_name,
+                table_name="tasks",
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
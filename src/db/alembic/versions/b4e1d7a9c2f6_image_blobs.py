@@ -0,0 +1,90 @@
+"""Image blobs
+
+Revision ID: b4e1d7a9c2f6
+Revises: 9d3a6c5f2e17
+Create Date: 2026-03-02 11:18:40.562117
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "b4e1d7a9c2f6"
+down_revision: Union[str, Sequence[str], None] = "9d3a6c5f2e17"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+IMAGE_BLOB_TABLES = ("users", "tasks", "completed_tasks")
+
+IMAGE_BLOB_REFS_FUNCTION = """
+CREATE OR REPLACE FUNCTION track_image_blob_refs() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP <> 'DELETE' AND NEW.img_blob IS NOT NULL THEN
+        INSERT INTO image_blobs (name, ref_count) VALUES (NEW.img_blob, 1)
+        ON CONFLICT (name) DO UPDATE SET ref_count = image_blobs.ref_count + 1;
+    END IF;
+    IF TG_OP <> 'INSERT' AND OLD.img_blob IS NOT NULL THEN
+        UPDATE image_blobs SET ref_count = ref_count - 1 WHERE name = OLD.img_blob;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "image_blobs",
+        sa.Column("name", sa.String(length=80), nullable=False),
+        sa.Column("ref_count", sa.Integer(), server_default="0", nullable=False),
+        sa.Column(
+            "created_at", sa.DateTime(), server_default=sa.text("now()"), nullable=False
+        ),
+        sa.PrimaryKeyConstraint("name"),
+    )
+    op.create_index(
+        "ix_image_blobs_unreferenced",
+        "image_blobs",
+        ["name"],
+        unique=False,
+        postgresql_where=sa.text("ref_count <= 0"),
+    )
+    for table in IMAGE_BLOB_TABLES:
+        op.add_column(table, sa.Column("img_blob", sa.String(length=80), nullable=True))
+
+    op.execute(IMAGE_BLOB_REFS_FUNCTION)
+    for table in IMAGE_BLOB_TABLES:
+        op.execute(
+            f"CREATE OR REPLACE TRIGGER {table}_img_blob_insert AFTER INSERT ON {table} "
+            "FOR EACH ROW WHEN (NEW.img_blob IS NOT NULL) "
+            "EXECUTE FUNCTION track_image_blob_refs()"
+        )
+        op.execute(
+            f"CREATE OR REPLACE TRIGGER {table}_img_blob_update AFTER UPDATE OF img_blob ON {table} "
+            "FOR EACH ROW WHEN (OLD.img_blob IS DISTINCT FROM NEW.img_blob) "
+            "EXECUTE FUNCTION track_image_blob_refs()"
+        )
+        op.execute(
+            f"CREATE OR REPLACE TRIGGER {table}_img_blob_delete AFTER DELETE ON {table} "
+            "FOR EACH ROW WHEN (OLD.img_blob IS NOT NULL) "
+            "EXECUTE FUNCTION track_image_blob_refs()"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in IMAGE_BLOB_TABLES:
+        for event in ("insert", "update", "delete"):
+            op.execute(f"DROP TRIGGER IF EXISTS {table}_img_blob_{event} ON {table}")
+        op.drop_column(table, "img_blob")
+    op.execute("DROP FUNCTION IF EXISTS track_image_blob_refs()")
+    op.drop_index(
+        "ix_image_blobs_unreferenced",
+        table_name="image_blobs",
+        postgresql_where=sa.text("ref_count <= 0"),
+    )
+    op.drop_table("image_blobs")
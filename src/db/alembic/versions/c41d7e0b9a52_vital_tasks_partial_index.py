@@ -0,0 +1,43 @@
+"""Vital tasks partial index
+
+Revision ID: c41d7e0b9a52
+Revises: 3f9c2a7d41e6
+Create Date: 2026-02-04 11:26:53.870211
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "c41d7e0b9a52"
+down_revision: Union[str, Sequence[str], None] = "3f9c2a7d41e6"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_tasks_user_id_vital",
+            "tasks",
+            ["user_id", "created_at", "id"],
+            unique=False,
+            postgresql_where=sa.text("priority = 'EXTREME'"),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_tasks_user_id_vital",
+            table_name="tasks",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
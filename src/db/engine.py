@@ -1,20 +1,98 @@
-from typing import Annotated
+from functools import partial
+from typing import Annotated, Optional
 
-from fastapi import Depends
-from sqlalchemy.ext.asyncio import (AsyncSession, async_sessionmaker,
-                                    create_async_engine)
+from fastapi import Depends, Request
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 
 from db.config import data_base_config
 from db.models import Base
+from db.pool import TimedQueuePool
+from db.replica import ReplicaMonitor
+from db.session import LazySession
 
-engine = create_async_engine(url=data_base_config.DATABASE_url_asyncpg, echo=False)
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+engine = create_async_engine(
+    url=data_base_config.DATABASE_url_asyncpg,
+    echo=False,
+    poolclass=TimedQueuePool,
+    **data_base_config.ENGINE_OPTIONS,
+)
 
 session_factory = async_sessionmaker(bind=engine, expire_on_commit=False)
 
+replica_engine = None
+replica_session_factory = None
+replica_monitor = None
+if data_base_config.REPLICA_url_asyncpg:
+    replica_engine = create_async_engine(
+        url=data_base_config.REPLICA_url_asyncpg,
+        echo=False,
+        poolclass=TimedQueuePool,
+        **data_base_config.ENGINE_OPTIONS,
+    )
+    replica_session_factory = async_sessionmaker(
+        bind=replica_engine, expire_on_commit=False
+    )
+    replica_monitor = ReplicaMonitor(
+        engine=replica_engine,
+        max_lag=data_base_config.DB_REPLICA_MAX_LAG,
+        check_interval=data_base_config.DB_REPLICA_CHECK_INTERVAL,
+        check_timeout=data_base_config.DB_REPLICA_CHECK_TIMEOUT,
+    )
+
+
+# Set by the current_user_uuid dependency, routes without it have no user
+def request_user_uuid(request: Request) -> Optional[str]:
+    return getattr(request.state, "user_uuid", None)
+
+
+async def primary_session_factory(request: Request) -> async_sessionmaker:
+    # Writers read from the primary for a while so they see their own changes
+    if replica_engine is not None and request.method not in SAFE_METHODS:
+        user_uuid = request_user_uuid(request=request)
+        if user_uuid is not None:
+            await request.app.state.redis.set(
+                f"{user_uuid}_read_primary",
+                1,
+                ex=data_base_config.DB_READ_YOUR_WRITES_SECONDS,
+            )
+    return session_factory
+
+
+async def get_session(request: Request):
+    session = LazySession(
+        resolve_factory=partial(primary_session_factory, request=request)
+    )
+    try:
+        yield session
+    finally:
+        await session.close()
+
+
+async def use_replica(request: Request) -> bool:
+    if replica_engine is None or not await replica_monitor.use_replica():
+        return False
+    user_uuid = request_user_uuid(request=request)
+    if user_uuid is None:
+        return True
+    return not await request.app.state.redis.exists(f"{user_uuid}_read_primary")
+
+
+async def read_session_factory(request: Request) -> async_sessionmaker:
+    if await use_replica(request=request):
+        return replica_session_factory
+    return session_factory
+
 
-async def get_session():
-    async with session_factory() as session:
+async def get_read_session(request: Request):
+    session = LazySession(
+        resolve_factory=partial(read_session_factory, request=request)
+    )
+    try:
         yield session
+    finally:
+        await session.close()
 
 
 async def create_user_table():
@@ -22,4 +100,5 @@ async def create_user_table():
         await conn.run_sync(Base.metadata.create_all)
 
 
-SessionDep = Annotated[AsyncSession, Depends(get_session)]
+SessionDep = Annotated[LazySession, Depends(get_session)]
+ReadSessionDep = Annotated[LazySession, Depends(get_read_session)]
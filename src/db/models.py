@@ -2,11 +2,12 @@ import enum
 from datetime import date, datetime
 from uuid import UUID as pyuuid
 
-from sqlalchemy import String, func, text
+from sqlalchemy import Index, String, event, func, text
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
-from db.types import DDMMYYYY
+from db.triggers import image_blob_refs_ddl
+from db.types import DeadlineType
 
 
 class Base(DeclarativeBase):
@@ -39,10 +40,58 @@ class UsersTable(Base):
     password: Mapped[str] = mapped_column(String(512), nullable=True)
     google_sub: Mapped[str] = mapped_column(String(256), nullable=True, unique=True)
     profile_pic: Mapped[str] = mapped_column(nullable=True)
+    img_blob: Mapped[str] = mapped_column(String(80), nullable=True)
+
+
+class ImageBlobsTable(Base):
+    __tablename__ = "image_blobs"
+    __table_args__ = (
+        Index(
+            "ix_image_blobs_unreferenced",
+            "name",
+            postgresql_where=text("ref_count <= 0"),
+        ),
+    )
+
+    name: Mapped[str] = mapped_column(String(80), primary_key=True)
+    ref_count: Mapped[int] = mapped_column(nullable=False, server_default="0")
+    created_at: Mapped[datetime] = mapped_column(
+        server_default=func.now(), nullable=False
+    )
 
 
 class TasksTable(Base):
     __tablename__ = "tasks"
+    __table_args__ = (
+        Index("ix_tasks_user_id_created_at_id", "user_id", "created_at", "id"),
+        Index(
+            "ix_tasks_user_id_vital",
+            "user_id",
+            "created_at",
+            "id",
+            postgresql_where=text("priority = 'EXTREME'"),
+        ),
+        Index("ix_tasks_user_id_deadline", "user_id", "deadline"),
+        Index(
+            "ix_tasks_user_id_deadline_open",
+            "user_id",
+            "deadline",
+            "id",
+            postgresql_where=text("status <> 'DONE'"),
+        ),
+        Index(
+            "ix_tasks_title_trgm",
+            "title",
+            postgresql_using="gin",
+            postgresql_ops={"title": "gin_trgm_ops"},
+        ),
+        Index(
+            "ix_tasks_description_trgm",
+            "description",
+            postgresql_using="gin",
+            postgresql_ops={"description": "gin_trgm_ops"},
+        ),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     user_id: Mapped[pyuuid] = mapped_column(UUID(as_uuid=True))
@@ -54,7 +103,8 @@ class TasksTable(Base):
     priority: Mapped[TaskPriority] = mapped_column(
         server_default=TaskPriority.LOW.value
     )
-    deadline: Mapped[date] = mapped_column(DDMMYYYY, nullable=False)
+    deadline: Mapped[date] = mapped_column(DeadlineType, nullable=False)
+    img_blob: Mapped[str] = mapped_column(String(80), nullable=True)
 
     created_at: Mapped[datetime] = mapped_column(
         server_default=func.now(), nullable=False
@@ -66,6 +116,23 @@ class TasksTable(Base):
 
 class CompletedTasksTable(Base):
     __tablename__ = "completed_tasks"
+    __table_args__ = (
+        Index(
+            "ix_completed_tasks_user_id_created_at_id", "user_id", "created_at", "id"
+        ),
+        Index(
+            "ix_completed_tasks_title_trgm",
+            "title",
+            postgresql_using="gin",
+            postgresql_ops={"title": "gin_trgm_ops"},
+        ),
+        Index(
+            "ix_completed_tasks_description_trgm",
+            "description",
+            postgresql_using="gin",
+            postgresql_ops={"description": "gin_trgm_ops"},
+        ),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, autoincrement=False)
     user_id: Mapped[pyuuid] = mapped_column(UUID(as_uuid=True))
@@ -75,7 +142,8 @@ class CompletedTasksTable(Base):
     priority: Mapped[TaskPriority] = mapped_column(
         server_default=TaskPriority.LOW.value
     )
-    deadline: Mapped[date] = mapped_column(DDMMYYYY, nullable=False)
+    deadline: Mapped[date] = mapped_column(DeadlineType, nullable=False)
+    img_blob: Mapped[str] = mapped_column(String(80), nullable=True)
 
     created_at: Mapped[datetime] = mapped_column(
         server_default=func.now(), nullable=False
@@ -83,3 +151,7 @@ class CompletedTasksTable(Base):
     updated_at: Mapped[datetime] = mapped_column(
         server_default=func.now(), onupdate=func.now(), nullable=False
     )
+
+
+for ddl in image_blob_refs_ddl():
+    event.listen(Base.metadata, "after_create", ddl.execute_if(dialect="postgresql"))
@@ -0,0 +1,96 @@
+import time
+from bisect import bisect_left
+from typing import Optional
+
+from sqlalchemy import exc
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.util.queue import AsyncAdaptedQueue
+
+LATENCY_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+)
+
+
+class Histogram:
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self) -> dict:
+        cumulative, total = {}, 0
+        for bound, count in zip((*self.buckets, "+Inf"), self.counts):
+            total += count
+            cumulative[str(bound)] = total
+        return {"buckets": cumulative, "count": self.count, "sum": self.sum}
+
+
+class PoolMetrics:
+    def __init__(self):
+        self.wait = Histogram()
+        self.checkout = Histogram()
+        self.timeouts = 0
+
+
+class TimedQueue(AsyncAdaptedQueue):
+    metrics: Optional[PoolMetrics] = None
+
+    # The pool only blocks here once size and overflow are exhausted
+    def get(self, block: bool = True, timeout: Optional[float] = None):
+        if not block or self.metrics is None:
+            return super().get(block, timeout)
+        started = time.perf_counter()
+        try:
+            return super().get(block, timeout)
+        finally:
+            self.metrics.wait.observe(time.perf_counter() - started)
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    _queue_class = TimedQueue
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+        self._pool.metrics = self.metrics
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        except exc.TimeoutError:
+            self.metrics.timeouts += 1
+            raise
+        finally:
+            self.metrics.checkout.observe(time.perf_counter() - started)
+
+    def recreate(self) -> "TimedQueuePool":
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        pool._pool.metrics = self.metrics
+        return pool
+
+
+def pool_status(engine: AsyncEngine) -> dict:
+    pool = engine.sync_engine.pool
+    status = {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+    }
+    metrics = getattr(pool, "metrics", None)
+    if metrics is not None:
+        status.update({
+            "timeouts": metrics.timeouts,
+            "wait_seconds": metrics.wait.snapshot(),
+            "checkout_seconds": metrics.checkout.snapshot(),
+        })
+    return status
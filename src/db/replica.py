@@ -0,0 +1,55 @@
+import asyncio
+import time
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+# An idle primary leaves the last replayed transaction old, so a replica that
+# has replayed everything it received counts as having no lag
+REPLICA_LAG_QUERY = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+""")
+
+
+class ReplicaMonitor:
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        max_lag: float,
+        check_interval: float,
+        check_timeout: float,
+    ):
+        self.engine = engine
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.check_timeout = check_timeout
+        self.checked_at = float("-inf")
+        self.lag = None
+        self.lock = asyncio.Lock()
+
+    @property
+    def is_fresh(self) -> bool:
+        return self.lag is not None and self.lag <= self.max_lag
+
+    async def check_lag(self) -> None:
+        try:
+            async with self.engine.connect() as conn:
+                lag = await asyncio.wait_for(
+                    conn.scalar(REPLICA_LAG_QUERY), timeout=self.check_timeout
+                )
+            self.lag = float(lag) if lag is not None else None
+        except (SQLAlchemyError, OSError, asyncio.TimeoutError):
+            self.lag = None
+        self.checked_at = time.monotonic()
+
+    async def use_replica(self) -> bool:
+        if time.monotonic() - self.checked_at >= self.check_interval:
+            async with self.lock:
+                if time.monotonic() - self.checked_at >= self.check_interval:
+                    await self.check_lag()
+        return self.is_fresh
@@ -0,0 +1,50 @@
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy.ext.asyncio import (AsyncSession, AsyncSessionTransaction,
+                                    async_sessionmaker)
+
+
+# Opens the session, and picks its engine, only when a query needs it
+class LazySession:
+    def __init__(self, resolve_factory: Callable[[], Awaitable[async_sessionmaker]]):
+        self.resolve_factory = resolve_factory
+        self.session: Optional[AsyncSession] = None
+
+    async def get(self) -> AsyncSession:
+        if self.session is None:
+            factory = await self.resolve_factory()
+            self.session = factory()
+        return self.session
+
+    def begin(self) -> "LazyTransaction":
+        return LazyTransaction(lazy_session=self)
+
+    async def execute(self, *args, **kwargs):
+        session = await self.get()
+        return await session.execute(*args, **kwargs)
+
+    async def stream(self, *args, **kwargs):
+        session = await self.get()
+        return await session.stream(*args, **kwargs)
+
+    async def connection(self, *args, **kwargs):
+        session = await self.get()
+        return await session.connection(*args, **kwargs)
+
+    async def close(self) -> None:
+        if self.session is not None:
+            await self.session.close()
+
+
+class LazyTransaction:
+    def __init__(self, lazy_session: LazySession):
+        self.lazy_session = lazy_session
+        self.transaction: Optional[AsyncSessionTransaction] = None
+
+    async def __aenter__(self) -> AsyncSessionTransaction:
+        session = await self.lazy_session.get()
+        self.transaction = session.begin()
+        return await self.transaction.__aenter__()
+
+    async def __aexit__(self, *exc_info):
+        return await self.transaction.__aexit__(*exc_info)
@@ -0,0 +1,42 @@
+from sqlalchemy import DDL
+
+# Keeps image_blobs.ref_count in step with every img_blob column, so deletes,
+# completions and evictions release images without the app tracking them
+IMAGE_BLOB_REFS_FUNCTION = """
+CREATE OR REPLACE FUNCTION track_image_blob_refs() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP <> 'DELETE' AND NEW.img_blob IS NOT NULL THEN
+        INSERT INTO image_blobs (name, ref_count) VALUES (NEW.img_blob, 1)
+        ON CONFLICT (name) DO UPDATE SET ref_count = image_blobs.ref_count + 1;
+    END IF;
+    IF TG_OP <> 'INSERT' AND OLD.img_blob IS NOT NULL THEN
+        UPDATE image_blobs SET ref_count = ref_count - 1 WHERE name = OLD.img_blob;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+"""
+
+IMAGE_BLOB_TABLES = ("users", "tasks", "completed_tasks")
+
+
+def image_blob_refs_triggers(table: str) -> list:
+    return [
+        f"CREATE OR REPLACE TRIGGER {table}_img_blob_insert AFTER INSERT ON {table} "
+        "FOR EACH ROW WHEN (NEW.img_blob IS NOT NULL) "
+        "EXECUTE FUNCTION track_image_blob_refs()",
+        f"CREATE OR REPLACE TRIGGER {table}_img_blob_update AFTER UPDATE OF img_blob ON {table} "
+        "FOR EACH ROW WHEN (OLD.img_blob IS DISTINCT FROM NEW.img_blob) "
+        "EXECUTE FUNCTION track_image_blob_refs()",
+        f"CREATE OR REPLACE TRIGGER {table}_img_blob_delete AFTER DELETE ON {table} "
+        "FOR EACH ROW WHEN (OLD.img_blob IS NOT NULL) "
+        "EXECUTE FUNCTION track_image_blob_refs()",
+    ]
+
+
+def image_blob_refs_ddl() -> list:
+    return [DDL(IMAGE_BLOB_REFS_FUNCTION)] + [
+        DDL(statement)
+        for table in IMAGE_BLOB_TABLES
+        for statement in image_blob_refs_triggers(table)
+    ]
@@ -1,13 +1,17 @@
-from datetime import datetime
+from datetime import date, datetime
 
 from sqlalchemy.types import Date, TypeDecorator
 
+from db.config import data_base_config
+
 
 class DDMMYYYY(TypeDecorator):
     impl = Date
     cache_ok = True
 
     def process_bind_param(self, value, dialect):
+        if isinstance(value, date):
+            return value
         if isinstance(value, str):
             return datetime.strptime(value, "%d/%m/%Y").date()
 
@@ -15,3 +19,7 @@ class DDMMYYYY(TypeDecorator):
 
     def process_result_value(self, value, dialect):
         return value.strftime("%d/%m/%Y")
+
+
+# Native dates skip the per-row conversion, formatting happens on serialization
+DeadlineType = Date if data_base_config.DB_NATIVE_DATES else DDMMYYYY
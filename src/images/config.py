@@ -0,0 +1,22 @@
+from pathlib import Path
+
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+BLOBS_DIR = Path(__file__).resolve().parent.parent.parent / "uploads" / "blobs"
+BLOBS_URL = "http://localhost:8000/uploads/blobs/"
+
+
+class ImagesConfig(BaseSettings):
+    IMAGE_MAX_UPLOAD_BYTES: int = 10 * 1024 * 1024
+    IMAGE_UPLOAD_CHUNK_SIZE: int = 64 * 1024
+
+    # Variants are rendered in a process pool; the semaphore caps queued work
+    IMAGE_VARIANT_PROCESSES: int = 2
+    IMAGE_VARIANT_CONCURRENCY: int = 4
+
+    model_config = SettingsConfigDict(
+        env_file=Path(__file__).parent.parent.parent / ".env", extra="ignore"
+    )
+
+
+images_config = ImagesConfig()
@@ -0,0 +1,311 @@
+import logging
+import os
+import shutil
+import time
+from dataclasses import dataclass, field
+from functools import partial
+from pathlib import Path
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional, Set
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from api.users.config import PROFILE_PHOTO_UPLOAD_DIR, PROFILE_PHOTO_URL
+from api.users.tasks.config import TASK_UPLOAD_DIR
+from db.models import CompletedTasksTable, ImageBlobsTable, TasksTable, UsersTable
+from images.config import BLOBS_DIR
+from images.store import (BLOBS_RELEASE_BATCH, blob_name, blob_path,
+                          release_blobs, unlink_blob)
+from images.upload import IMAGE_SIGNATURES
+from images.variants import variant_paths
+
+GC_BATCH_SIZE = 10000
+# Files younger than this may belong to a row that is not committed yet
+GC_GRACE_SECONDS = 3600
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class GCStats:
+    scanned: int = 0
+    orphans: int = 0
+    orphan_bytes: int = 0
+    skipped_recent: int = 0
+    errors: int = 0
+    started: float = field(default_factory=time.perf_counter)
+
+    def summary(self) -> dict:
+        elapsed = time.perf_counter() - self.started
+        return {
+            "scanned": self.scanned,
+            "orphans": self.orphans,
+            "orphan_bytes": self.orphan_bytes,
+            "skipped_recent": self.skipped_recent,
+            "errors": self.errors,
+            "elapsed_seconds": round(elapsed, 3),
+            "files_per_second": round(self.scanned / elapsed, 1) if elapsed else 0.0,
+        }
+
+
+async def keyset_batches(
+    session: AsyncSession,
+    query,
+    key_column,
+    batch_size: int = GC_BATCH_SIZE,
+) -> AsyncIterator[list]:
+    last_key = None
+    while True:
+        page = query.order_by(key_column).limit(batch_size)
+        if last_key is not None:
+            page = page.where(key_column > last_key)
+        rows = (await session.execute(page)).all()
+        if not rows:
+            return
+        yield rows
+        last_key = rows[-1][0]
+
+
+# Legacy task images are named {task_id}_{user_uuid}, and only count while the
+# task has not moved on to a blob
+async def referenced_task_images(session: AsyncSession) -> Set[str]:
+    keys = set()
+    for table in (TasksTable, CompletedTasksTable):
+        query = select(table.id, table.user_id).where(table.img_blob.is_(None))
+        async for rows in keyset_batches(session, query, table.id):
+            keys.update(f"{task_id}_{user_id}" for task_id, user_id in rows)
+    return keys
+
+
+async def referenced_avatars(session: AsyncSession) -> Set[str]:
+    keys = set()
+    query = select(UsersTable.id, UsersTable.profile_pic).where(
+        UsersTable.profile_pic.startswith(PROFILE_PHOTO_URL, autoescape=True)
+    )
+    async for rows in keyset_batches(session, query, UsersTable.id):
+        keys.update(
+            str(user_id)
+            for user_id, profile_pic in rows
+            if profile_pic == f"{PROFILE_PHOTO_URL}{user_id}.jpeg"
+        )
+    return keys
+
+
+async def referenced_blobs(session: AsyncSession) -> Set[str]:
+    keys = set()
+    query = select(ImageBlobsTable.name).where(ImageBlobsTable.ref_count > 0)
+    async for rows in keyset_batches(session, query, ImageBlobsTable.name):
+        keys.update(name.split(".", 1)[0] for name, in rows)
+    return keys
+
+
+# Originals and their _{size}.{fmt} variants map to the same key
+def task_image_key(name: str) -> str:
+    return "_".join(name.rsplit(".", 1)[0].split("_")[:2])
+
+
+def avatar_key(name: str) -> str:
+    return name.rsplit(".", 1)[0].split("_")[0]
+
+
+def blob_key(name: str) -> str:
+    return name.rsplit(".", 1)[0].split("_")[0]
+
+
+def walk_files(directory: Path) -> Iterator[os.DirEntry]:
+    stack = [directory]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        yield entry
+        except FileNotFoundError:
+            continue
+
+
+def remove_orphan(
+    path: str,
+    upload_dir: Path,
+    quarantine_dir: Optional[Path],
+) -> None:
+    if quarantine_dir is not None:
+        target = quarantine_dir / Path(path).relative_to(upload_dir)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.move(path, target)
+    else:
+        os.remove(path)
+
+
+# Orphans whose key is collected into `deferred` are left for the caller to
+# remove under a lock; everything else is removed here
+def collect_orphans(
+    directory: Path,
+    key_of: Callable[[str], str],
+    referenced: Set[str],
+    stats: GCStats,
+    cutoff: float,
+    upload_dir: Path,
+    quarantine_dir: Optional[Path],
+    dry_run: bool,
+    deferred: Optional[Dict[str, List[int]]] = None,
+) -> None:
+    for entry in walk_files(directory):
+        stats.scanned += 1
+        try:
+            stat_result = entry.stat(follow_symlinks=False)
+            if stat_result.st_mtime > cutoff:
+                stats.skipped_recent += 1
+                continue
+            # Half-written temp files are orphans once past the grace period
+            is_tmp = entry.name.startswith(".")
+            if not is_tmp and key_of(entry.name) in referenced:
+                continue
+            if not is_tmp and deferred is not None:
+                deferred.setdefault(key_of(entry.name), []).append(stat_result.st_size)
+                continue
+
+            stats.orphans += 1
+            stats.orphan_bytes += stat_result.st_size
+            if dry_run:
+                logger.info("Orphan %s", entry.path)
+            else:
+                remove_orphan(
+                    path=entry.path, upload_dir=upload_dir, quarantine_dir=quarantine_dir
+                )
+        except OSError:
+            stats.errors += 1
+            logger.exception("Failed to collect %s", entry.path)
+
+
+async def quarantine_blob(name: str, upload_dir: Path, quarantine_dir: Path) -> None:
+    filepath = blob_path(name)
+    for path in (filepath, *variant_paths(filepath)):
+        try:
+            remove_orphan(
+                path=str(path), upload_dir=upload_dir, quarantine_dir=quarantine_dir
+            )
+        except FileNotFoundError:
+            continue
+
+
+# The referenced_blobs snapshot is already stale here, so each batch is
+# re-checked under image_blobs row locks, the same way uploads and
+# release_blobs order themselves. Placeholder rows cover files that have no
+# row: an upload of the same image then waits for this transaction instead
+# of finding its file gone after it committed. Every type of a digest shares
+# its variant files, so a digest is released only with all its rows locked
+async def release_orphaned_blobs(
+    session: AsyncSession,
+    orphans: Dict[str, List[int]],
+    stats: GCStats,
+    upload_dir: Path,
+    quarantine_dir: Optional[Path],
+    dry_run: bool,
+    batch_size: int = BLOBS_RELEASE_BATCH,
+) -> None:
+    digests = list(orphans)
+    remove = unlink_blob
+    if quarantine_dir is not None:
+        remove = partial(
+            quarantine_blob, upload_dir=upload_dir, quarantine_dir=quarantine_dir
+        )
+    for start in range(0, len(digests), batch_size):
+        batch = digests[start:start + batch_size]
+        if dry_run:
+            released = set(batch)
+            logger.info("Orphan blobs %s", batch)
+        else:
+            names = sorted(
+                blob_name(digest, image_type)
+                for digest in batch
+                for image_type in IMAGE_SIGNATURES.values()
+            )
+            try:
+                async with session.begin():
+                    placeholders = set(await session.scalars(
+                        insert(ImageBlobsTable)
+                        .values([{"name": name, "ref_count": 0} for name in names])
+                        .on_conflict_do_nothing()
+                        .returning(ImageBlobsTable.name)
+                    ))
+                    rows = await session.execute(
+                        select(ImageBlobsTable.name, ImageBlobsTable.ref_count)
+                        .where(ImageBlobsTable.name.in_(names))
+                        .order_by(ImageBlobsTable.name)
+                        .with_for_update(skip_locked=True)
+                    )
+                    locked = {name: ref_count for name, ref_count in rows}
+                    busy = {
+                        blob_key(name)
+                        for name in names
+                        if locked.get(name, 1) > 0
+                    }
+                    # Left behind, they would have release_blobs unlink the
+                    # variants of the referenced type
+                    await session.execute(
+                        delete(ImageBlobsTable).where(
+                            ImageBlobsTable.name.in_(
+                                [name for name in placeholders if blob_key(name) in busy]
+                            )
+                        )
+                    )
+                    names = [name for name in names if blob_key(name) not in busy]
+                    released = {
+                        blob_key(name)
+                        for name in await release_blobs(
+                            session=session,
+                            names=names,
+                            limit=len(names),
+                            remove=remove,
+                        )
+                    }
+            except OSError:
+                stats.errors += len(batch)
+                logger.exception("Failed to collect blobs %s", batch)
+                continue
+        for digest in released:
+            stats.orphans += len(orphans[digest])
+            stats.orphan_bytes += sum(orphans[digest])
+
+
+async def collect_orphaned_uploads(
+    session: AsyncSession,
+    upload_dir: Path,
+    quarantine_dir: Optional[Path] = None,
+    dry_run: bool = False,
+    grace_seconds: int = GC_GRACE_SECONDS,
+) -> GCStats:
+    stats = GCStats()
+    cutoff = time.time() - grace_seconds
+    async with session.begin():
+        sources = (
+            (TASK_UPLOAD_DIR, task_image_key, await referenced_task_images(session)),
+            (PROFILE_PHOTO_UPLOAD_DIR, avatar_key, await referenced_avatars(session)),
+            (BLOBS_DIR, blob_key, await referenced_blobs(session)),
+        )
+    orphan_blobs: Dict[str, List[int]] = {}
+    for directory, key_of, referenced in sources:
+        collect_orphans(
+            directory=directory,
+            key_of=key_of,
+            referenced=referenced,
+            stats=stats,
+            cutoff=cutoff,
+            upload_dir=upload_dir,
+            quarantine_dir=quarantine_dir,
+            dry_run=dry_run,
+            deferred=orphan_blobs if directory == BLOBS_DIR else None,
+        )
+    await release_orphaned_blobs(
+        session=session,
+        orphans=orphan_blobs,
+        stats=stats,
+        upload_dir=upload_dir,
+        quarantine_dir=quarantine_dir,
+        dry_run=dry_run,
+    )
+    return stats
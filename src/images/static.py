@@ -0,0 +1,39 @@
+import os
+from os import PathLike
+
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse
+from starlette.types import Scope
+
+BLOBS_PREFIX = "blobs" + os.sep
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "public, no-cache"
+
+
+# Blob and variant names are derived from the content, so their URLs never
+# change meaning: the name itself is a strong ETag that every replica agrees
+# on. Legacy per-task and per-user files can be overwritten and are revalidated.
+# FileResponse already answers Range requests and uses http.response.pathsend
+# when the server offers it.
+class ImageStaticFiles(StaticFiles):
+    def file_response(
+        self,
+        full_path: PathLike,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        request_headers = Headers(scope=scope)
+
+        response = FileResponse(full_path, status_code=status_code, stat_result=stat_result)
+        if self.get_path(scope).startswith(BLOBS_PREFIX):
+            response.headers["etag"] = f'"{os.path.basename(full_path)}"'
+            response.headers["cache-control"] = IMMUTABLE_CACHE_CONTROL
+        else:
+            response.headers["cache-control"] = REVALIDATE_CACHE_CONTROL
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
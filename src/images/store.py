@@ -0,0 +1,125 @@
+import asyncio
+from pathlib import Path
+from typing import Any, Awaitable, Callable, List, Optional
+
+import aiofiles.os
+from fastapi import UploadFile
+from PIL import Image
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.models import ImageBlobsTable
+from images.config import BLOBS_DIR, BLOBS_URL
+from images.upload import ImageTypeError, discard_tmp, receive_upload
+from images.variants import generate_variants, has_variants, variant_paths
+
+BLOBS_TMP_DIR = BLOBS_DIR / ".tmp"
+BLOBS_RELEASE_BATCH = 500
+
+
+def blob_name(digest: str, image_type: str) -> str:
+    return f"{digest}.{image_type}"
+
+
+# Two shard levels keep every directory at a few thousand entries at most
+def blob_shard(name: str) -> str:
+    return f"{name[:2]}/{name[2:4]}"
+
+
+def blob_path(name: str) -> Path:
+    return BLOBS_DIR / blob_shard(name) / name
+
+
+def blob_url(name: str) -> str:
+    return f"{BLOBS_URL}{blob_shard(name)}/{name}"
+
+
+async def receive_blob(upload: UploadFile) -> tuple[Path, str]:
+    await aiofiles.os.makedirs(BLOBS_TMP_DIR, exist_ok=True)
+    received = await receive_upload(upload=upload, directory=BLOBS_TMP_DIR)
+    return received.path, blob_name(received.digest, received.image_type)
+
+
+# Must run after the new reference is written in the same transaction: the
+# image_blobs row lock then orders it against release_blobs unlinking the file
+async def place_blob(tmp_path: Path, name: str) -> None:
+    target = blob_path(name)
+    if await aiofiles.os.path.exists(target):
+        await discard_tmp(tmp_path)
+        return
+    await aiofiles.os.makedirs(target.parent, exist_ok=True)
+    for tmp_variant, variant in zip(variant_paths(tmp_path), variant_paths(target)):
+        if await aiofiles.os.path.exists(tmp_variant):
+            await aiofiles.os.replace(tmp_variant, variant)
+    await aiofiles.os.replace(tmp_path, target)
+
+
+async def render_blob_variants(source: Path, target: Path) -> None:
+    try:
+        await generate_variants(source=source, target=target)
+    # Pillow reports data it cannot decode as OSError
+    except (OSError, Image.DecompressionBombError) as exc:
+        raise ImageTypeError() from exc
+
+
+async def unlink_blob(name: str) -> None:
+    filepath = blob_path(name)
+    for path in (filepath, *variant_paths(filepath)):
+        try:
+            await aiofiles.os.remove(path)
+        except FileNotFoundError:
+            continue
+
+
+# Files are removed before the caller commits, while the rows are still locked
+async def release_blobs(
+    session: AsyncSession,
+    names: Optional[List[str]] = None,
+    limit: int = BLOBS_RELEASE_BATCH,
+    remove: Callable[[str], Awaitable[None]] = unlink_blob,
+) -> List[str]:
+    unreferenced = select(ImageBlobsTable.name).where(ImageBlobsTable.ref_count <= 0)
+    if names is not None:
+        unreferenced = unreferenced.where(ImageBlobsTable.name.in_(names))
+    unreferenced = unreferenced.limit(limit).with_for_update(skip_locked=True)
+
+    result = await session.execute(
+        delete(ImageBlobsTable)
+        .where(
+            ImageBlobsTable.name.in_(unreferenced.scalar_subquery()),
+            ImageBlobsTable.ref_count <= 0,
+        )
+        .returning(ImageBlobsTable.name)
+    )
+    released = list(result.scalars().all())
+    for name in released:
+        await remove(name)
+    return released
+
+
+# set_reference(img_blob=...) points the owner row at the new blob and returns
+# it with the previous blob as old_img_blob. Variants are rendered next to the
+# temp file before the transaction, so no connection or row lock is held while
+# Pillow runs, and are moved into place with the original
+async def store_blob(
+    session: AsyncSession,
+    upload: UploadFile,
+    set_reference: Callable[..., Awaitable[Any]],
+) -> Any:
+    tmp_path, name = await receive_blob(upload=upload)
+    target = blob_path(name)
+    try:
+        if not await asyncio.to_thread(has_variants, target):
+            await render_blob_variants(source=tmp_path, target=tmp_path)
+        async with session.begin():
+            row = await set_reference(img_blob=name)
+            await place_blob(tmp_path=tmp_path, name=name)
+            # Only when a release unlinked the blob after the check above
+            if not await asyncio.to_thread(has_variants, target):
+                await render_blob_variants(source=target, target=target)
+            if row.old_img_blob and row.old_img_blob != name:
+                await release_blobs(session=session, names=[row.old_img_blob])
+    finally:
+        for path in (tmp_path, *variant_paths(tmp_path)):
+            await discard_tmp(path)
+    return row
@@ -0,0 +1,78 @@
+import hashlib
+from pathlib import Path
+from typing import NamedTuple, Optional
+from uuid import uuid4
+
+import aiofiles
+import aiofiles.os
+from fastapi import UploadFile
+
+from images.config import images_config
+
+IMAGE_SIGNATURES = {
+    b"\xff\xd8\xff": "jpeg",
+    b"\x89PNG\r\n\x1a\n": "png",
+}
+
+
+class ImageUploadError(Exception):
+    pass
+
+
+class ImageTypeError(ImageUploadError):
+    pass
+
+
+class ImageTooLargeError(ImageUploadError):
+    pass
+
+
+class ReceivedUpload(NamedTuple):
+    path: Path
+    image_type: str
+    digest: str
+
+
+def detect_image_type(head: bytes) -> Optional[str]:
+    for signature, image_type in IMAGE_SIGNATURES.items():
+        if head.startswith(signature):
+            return image_type
+    return None
+
+
+# The upload is copied chunk by chunk into a temp file in the target directory
+# and hashed on the way, so the caller can rename it into place by content
+async def receive_upload(
+    upload: UploadFile,
+    directory: Path,
+    max_size: int = images_config.IMAGE_MAX_UPLOAD_BYTES,
+) -> ReceivedUpload:
+    tmp_path = directory / f".{uuid4().hex}.tmp"
+    digest = hashlib.sha256()
+    size = 0
+    image_type = None
+    try:
+        async with aiofiles.open(tmp_path, mode="wb") as f:
+            while chunk := await upload.read(images_config.IMAGE_UPLOAD_CHUNK_SIZE):
+                if image_type is None:
+                    image_type = detect_image_type(chunk)
+                    if image_type is None:
+                        raise ImageTypeError()
+                size += len(chunk)
+                if size > max_size:
+                    raise ImageTooLargeError()
+                digest.update(chunk)
+                await f.write(chunk)
+        if image_type is None:
+            raise ImageTypeError()
+    except BaseException:
+        await discard_tmp(tmp_path)
+        raise
+    return ReceivedUpload(tmp_path, image_type, digest.hexdigest())
+
+
+async def discard_tmp(tmp_path: Path) -> None:
+    try:
+        await aiofiles.os.remove(tmp_path)
+    except FileNotFoundError:
+        pass
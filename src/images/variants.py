@@ -0,0 +1,93 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+from uuid import uuid4
+
+from PIL import Image, ImageOps
+
+from images.config import images_config
+
+VARIANT_SIZES = (64, 256, 1024)
+VARIANT_FORMATS = {"webp": "WEBP", "jpeg": "JPEG"}
+VARIANT_SAVE_OPTIONS = {
+    "webp": {"quality": 80, "method": 4},
+    "jpeg": {"quality": 85, "optimize": True, "progressive": True},
+}
+DEFAULT_VARIANT_FORMAT = "webp"
+
+_executor: Optional[ProcessPoolExecutor] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+
+
+def variant_name(name: str, size: int, fmt: str = DEFAULT_VARIANT_FORMAT) -> str:
+    return f"{name.rsplit('.', 1)[0]}_{size}.{fmt}"
+
+
+def variant_paths(filepath: Path) -> List[Path]:
+    return [
+        filepath.with_name(variant_name(filepath.name, size, fmt))
+        for size in VARIANT_SIZES
+        for fmt in VARIANT_FORMATS
+    ]
+
+
+def variant_names(name: str, fmt: str = DEFAULT_VARIANT_FORMAT) -> Dict[str, str]:
+    return {str(size): variant_name(name, size, fmt) for size in VARIANT_SIZES}
+
+
+def pick_variant_size(size: int) -> int:
+    for variant_size in VARIANT_SIZES:
+        if variant_size >= size:
+            return variant_size
+    return VARIANT_SIZES[-1]
+
+
+def has_variants(filepath: Path) -> bool:
+    return all(path.exists() for path in variant_paths(filepath))
+
+
+# Runs inside the process pool, so it must stay a plain top-level function.
+# Variants of source are written under the names of target's variants
+def render_variants(source: str, target: str) -> None:
+    filepath = Path(target)
+    # Blobs never change, so variants rendered once stay valid
+    if has_variants(filepath):
+        return
+    with Image.open(source) as img:
+        img = ImageOps.exif_transpose(img).convert("RGB")
+        for size in sorted(VARIANT_SIZES, reverse=True):
+            img.thumbnail((size, size))
+            for fmt, pil_format in VARIANT_FORMATS.items():
+                target = filepath.with_name(variant_name(filepath.name, size, fmt))
+                tmp_path = target.with_name(f".{target.name}.{uuid4().hex}.tmp")
+                img.save(tmp_path, pil_format, **VARIANT_SAVE_OPTIONS[fmt])
+                os.replace(tmp_path, target)
+
+
+def get_variants_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=images_config.IMAGE_VARIANT_PROCESSES
+        )
+    return _executor
+
+
+def shutdown_variants_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(cancel_futures=True)
+        _executor = None
+
+
+async def generate_variants(source: Path, target: Path) -> None:
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(images_config.IMAGE_VARIANT_CONCURRENCY)
+    async with _semaphore:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            get_variants_executor(), render_variants, str(source), str(target)
+        )
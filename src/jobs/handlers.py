@@ -0,0 +1,35 @@
+from typing import List, Optional
+
+from redis.asyncio import Redis
+
+from api.users.tasks.crud_redis import (delete_tasks_r, schedule_reminders_r,
+                                        update_tasks_r)
+from api.users.tasks.service import delete_task_imgs
+from db.engine import session_factory
+from images.store import release_blobs
+
+
+# The deleted rows already dropped their references to old_blobs, so those
+# are released unless another task still uses them; the GC sweeps the rest
+async def delete_task_imgs_job(
+    redis: Redis,
+    user_uuid: str,
+    task_ids: List[int],
+    old_blobs: Optional[List[str]] = None,
+) -> None:
+    await delete_task_imgs(user_uuid=user_uuid, task_ids=task_ids)
+    if not old_blobs:
+        return
+    async with session_factory() as session:
+        async with session.begin():
+            await release_blobs(
+                session=session, names=old_blobs, limit=len(old_blobs)
+            )
+
+
+JOB_HANDLERS = {
+    "update_tasks": update_tasks_r,
+    "delete_tasks": delete_tasks_r,
+    "schedule_reminders": schedule_reminders_r,
+    "delete_task_imgs": delete_task_imgs_job,
+}
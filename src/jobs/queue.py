@@ -0,0 +1,302 @@
+import json
+import time
+from typing import Optional
+from uuid import uuid4
+
+from redis.asyncio import Redis
+
+from api.users.tasks.crud_redis import RELEASE_LOCK_SCRIPT
+
+JOBS_QUEUE_KEY = "jobs:queue"
+JOBS_DELAYED_KEY = "jobs:delayed"
+JOBS_DEAD_KEY = "jobs:dead"
+# Worker name -> last heartbeat; workers that stop beating lose their jobs
+JOBS_WORKERS_KEY = "jobs:workers"
+
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_BASE_DELAY = 1.0
+JOB_RETRY_MAX_DELAY = 60.0
+JOBS_PROMOTE_BATCH = 100
+
+# Jobs sharing an ordering key wait in their own list and are run one at a
+# time, in enqueue order, by whichever worker holds the key's lease
+DRAIN_ORDERED_JOBS = "drain_ordered_jobs"
+JOBS_ORDERED_LEASE_MS = 30000
+
+# KEYS: delayed jobs zset, jobs queue
+# ARGV: current timestamp, batch size
+PROMOTE_DELAYED_JOBS_SCRIPT = """
+local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+for _, job in ipairs(due) do
+    redis.call('ZREM', KEYS[1], job)
+    redis.call('LPUSH', KEYS[2], job)
+end
+return #due
+"""
+
+# KEYS: ordered jobs list, lease key
+# ARGV: lease token, lease ms, finished job
+ACK_ORDERED_JOB_SCRIPT = """
+if redis.call('GET', KEYS[2]) ~= ARGV[1] then
+    return 0
+end
+if redis.call('LINDEX', KEYS[1], 0) == ARGV[3] then
+    redis.call('LPOP', KEYS[1])
+end
+redis.call('PEXPIRE', KEYS[2], ARGV[2])
+return 1
+"""
+
+# KEYS: ordered jobs list, lease key, delayed jobs zset, dead jobs list
+# ARGV: lease token, failed job, failed job with the attempt recorded,
+#       retry timestamp or '' to give up, drain job
+# A retried job stays at the head so nothing queued behind it overtakes it
+RETRY_ORDERED_JOB_SCRIPT = """
+if redis.call('GET', KEYS[2]) ~= ARGV[1] then
+    return 0
+end
+if redis.call('LINDEX', KEYS[1], 0) ~= ARGV[2] then
+    return 0
+end
+if ARGV[4] == '' then
+    redis.call('LPOP', KEYS[1])
+    redis.call('LPUSH', KEYS[4], ARGV[3])
+else
+    redis.call('LSET', KEYS[1], 0, ARGV[3])
+    redis.call('ZADD', KEYS[3], ARGV[4], ARGV[5])
+end
+return 1
+"""
+
+
+def processing_key(worker_name: str) -> str:
+    return f"jobs:processing:{worker_name}"
+
+
+def ordered_key(ordering_key: str) -> str:
+    return f"jobs:ordered:{ordering_key}"
+
+
+def ordered_lease_key(ordering_key: str) -> str:
+    return f"jobs:ordered:{ordering_key}:lease"
+
+
+def retry_delay(attempts: int) -> float:
+    return min(JOB_RETRY_BASE_DELAY * 2 ** (attempts - 1), JOB_RETRY_MAX_DELAY)
+
+
+def encode_job(name: str, kwargs: dict) -> str:
+    job = {"id": uuid4().hex, "name": name, "kwargs": kwargs, "attempts": 0}
+    return json.dumps(job, ensure_ascii=False)
+
+
+def drain_job(ordering_key: str) -> str:
+    return encode_job(DRAIN_ORDERED_JOBS, {"ordering_key": ordering_key})
+
+
+async def enqueue_job_r(
+    redis: Redis,
+    name: str,
+    ordering_key: Optional[str] = None,
+    **kwargs,
+) -> None:
+    if ordering_key is None:
+        await redis.lpush(JOBS_QUEUE_KEY, encode_job(name, kwargs))
+        return
+
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.rpush(ordered_key(ordering_key), encode_job(name, kwargs))
+        pipe.lpush(JOBS_QUEUE_KEY, drain_job(ordering_key))
+        await pipe.execute()
+
+
+async def reserve_job_r(
+    redis: Redis,
+    worker_name: str,
+    timeout: float,
+) -> Optional[bytes]:
+    return await redis.blmove(
+        JOBS_QUEUE_KEY, processing_key(worker_name), timeout, "RIGHT", "LEFT"
+    )
+
+
+async def ack_job_r(
+    redis: Redis,
+    worker_name: str,
+    raw_job: bytes,
+) -> None:
+    await redis.lrem(processing_key(worker_name), 1, raw_job)
+
+
+# Payloads that can't be decoded go straight to the dead letters, verbatim
+def failed_job(raw_job: bytes, error: str) -> dict:
+    try:
+        job = json.loads(raw_job)
+        job["attempts"] += 1
+    except (ValueError, TypeError, KeyError):
+        job = {"raw": raw_job.decode(errors="replace"), "attempts": JOB_MAX_ATTEMPTS}
+    job["error"] = error
+    return job
+
+
+async def retry_job_r(
+    redis: Redis,
+    worker_name: str,
+    raw_job: bytes,
+    error: str,
+) -> bool:
+    job = failed_job(raw_job=raw_job, error=error)
+    will_retry = job["attempts"] < JOB_MAX_ATTEMPTS
+
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.lrem(processing_key(worker_name), 1, raw_job)
+        if will_retry:
+            pipe.zadd(
+                JOBS_DELAYED_KEY,
+                {json.dumps(job, ensure_ascii=False): time.time() + retry_delay(job["attempts"])},
+            )
+        else:
+            pipe.lpush(JOBS_DEAD_KEY, json.dumps(job, ensure_ascii=False))
+        await pipe.execute()
+    return will_retry
+
+
+async def promote_delayed_jobs_r(
+    redis: Redis,
+    now: float,
+) -> int:
+    promote_delayed_jobs = redis.register_script(PROMOTE_DELAYED_JOBS_SCRIPT)
+    return await promote_delayed_jobs(
+        keys=[JOBS_DELAYED_KEY, JOBS_QUEUE_KEY], args=[now, JOBS_PROMOTE_BATCH]
+    )
+
+
+async def heartbeat_r(
+    redis: Redis,
+    worker_name: str,
+    now: float,
+) -> None:
+    await redis.zadd(JOBS_WORKERS_KEY, {worker_name: now})
+
+
+# Jobs left in processing by a crashed run of this worker go back to the queue
+async def requeue_processing_jobs_r(
+    redis: Redis,
+    worker_name: str,
+) -> int:
+    requeued = 0
+    while await redis.lmove(
+        processing_key(worker_name), JOBS_QUEUE_KEY, "LEFT", "RIGHT"
+    ):
+        requeued += 1
+    return requeued
+
+
+async def acquire_ordered_lease_r(
+    redis: Redis,
+    ordering_key: str,
+) -> Optional[str]:
+    token = uuid4().hex
+    acquired = await redis.set(
+        ordered_lease_key(ordering_key), token, nx=True, px=JOBS_ORDERED_LEASE_MS
+    )
+    return token if acquired else None
+
+
+async def release_ordered_lease_r(
+    redis: Redis,
+    ordering_key: str,
+    token: str,
+) -> None:
+    release_lease = redis.register_script(RELEASE_LOCK_SCRIPT)
+    await release_lease(keys=[ordered_lease_key(ordering_key)], args=[token])
+
+
+# Used when the lease is taken: the holder may have died, so drain again once
+# it would have expired
+async def delay_drain_r(
+    redis: Redis,
+    ordering_key: str,
+) -> None:
+    await redis.zadd(
+        JOBS_DELAYED_KEY,
+        {drain_job(ordering_key): time.time() + JOBS_ORDERED_LEASE_MS / 1000},
+    )
+
+
+async def next_ordered_job_r(
+    redis: Redis,
+    ordering_key: str,
+) -> Optional[bytes]:
+    return await redis.lindex(ordered_key(ordering_key), 0)
+
+
+async def has_ordered_jobs_r(
+    redis: Redis,
+    ordering_key: str,
+) -> bool:
+    return bool(await redis.llen(ordered_key(ordering_key)))
+
+
+# Returns False once the lease is lost, the caller must stop draining then
+async def ack_ordered_job_r(
+    redis: Redis,
+    ordering_key: str,
+    token: str,
+    raw_job: bytes,
+) -> bool:
+    ack_ordered_job = redis.register_script(ACK_ORDERED_JOB_SCRIPT)
+    return bool(await ack_ordered_job(
+        keys=[ordered_key(ordering_key), ordered_lease_key(ordering_key)],
+        args=[token, JOBS_ORDERED_LEASE_MS, raw_job],
+    ))
+
+
+# Returns True if the job will be retried, which blocks the jobs behind it
+async def retry_ordered_job_r(
+    redis: Redis,
+    ordering_key: str,
+    token: str,
+    raw_job: bytes,
+    error: str,
+) -> bool:
+    job = failed_job(raw_job=raw_job, error=error)
+    will_retry = job["attempts"] < JOB_MAX_ATTEMPTS
+    retry_at = ""
+    if will_retry:
+        retry_at = job["retry_at"] = time.time() + retry_delay(job["attempts"])
+
+    retry_ordered_job = redis.register_script(RETRY_ORDERED_JOB_SCRIPT)
+    await retry_ordered_job(
+        keys=[
+            ordered_key(ordering_key),
+            ordered_lease_key(ordering_key),
+            JOBS_DELAYED_KEY,
+            JOBS_DEAD_KEY,
+        ],
+        args=[
+            token,
+            raw_job,
+            json.dumps(job, ensure_ascii=False),
+            retry_at,
+            drain_job(ordering_key),
+        ],
+    )
+    return will_retry
+
+
+# Workers whose heartbeat is older than the TTL are presumed dead, whatever
+# host they ran on; their unfinished jobs go back to the queue
+async def reclaim_dead_workers_r(
+    redis: Redis,
+    now: float,
+    worker_ttl: float,
+) -> int:
+    requeued = 0
+    dead_workers = await redis.zrangebyscore(JOBS_WORKERS_KEY, "-inf", now - worker_ttl)
+    for worker_name in dead_workers:
+        requeued += await requeue_processing_jobs_r(
+            redis=redis, worker_name=worker_name.decode()
+        )
+        await redis.zrem(JOBS_WORKERS_KEY, worker_name)
+    return requeued
@@ -4,11 +4,14 @@ from pathlib import Path
 import uvicorn
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 
 from api.auth.router import auth_router
+from api.metrics.router import metrics_router
 from api.users.router import users_router
 from api.users.tasks.router import users_tasks_router
+from compression.middleware import CompressionMiddleware
+from images.static import ImageStaticFiles
+from images.variants import shutdown_variants_executor
 from redis_utils.client import close_redis, init_redis
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -18,17 +21,22 @@ UPLOAD_DIR = BASE_DIR / "uploads"
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     redis = await init_redis()
+    redis_bytes = await init_redis(decode_responses=False)
     app.state.redis = redis
+    app.state.redis_bytes = redis_bytes
     try:
         yield
     finally:
         await close_redis(redis)
+        await close_redis(redis_bytes)
+        shutdown_variants_executor()
 
 
 app = FastAPI(lifespan=lifespan)
 app.include_router(auth_router)
 app.include_router(users_router)
 app.include_router(users_tasks_router)
+app.include_router(metrics_router)
 
 app.add_middleware(
     CORSMiddleware,
@@ -36,9 +44,11 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
+app.add_middleware(CompressionMiddleware, excluded_paths=("/uploads",))
 
-app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
+app.mount("/uploads", ImageStaticFiles(directory=UPLOAD_DIR), name="uploads")
 
 if __name__ == "__main__":
     uvicorn.run("main:app", reload=True, host="0.0.0.0")
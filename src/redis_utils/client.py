@@ -4,9 +4,9 @@ from redis.asyncio import Redis
 from redis_utils.config import redis_config
 
 
-async def init_redis() -> Redis:
+async def init_redis(decode_responses: bool = True) -> Redis:
     redis = Redis.from_url(
-        redis_config.REDIS_URL, encoding="utf-8", decode_responses=True
+        redis_config.REDIS_URL, encoding="utf-8", decode_responses=decode_responses
     )
 
     return redis
@@ -18,3 +18,7 @@ async def close_redis(redis: Redis):
 
 def get_redis(request: Request) -> Redis:
     return request.app.state.redis
+
+
+def get_redis_bytes(request: Request) -> Redis:
+    return request.app.state.redis_bytes
@@ -0,0 +1,62 @@
+from typing import Optional
+
+from redis.asyncio import Redis
+from redis.asyncio.client import Pipeline
+
+VERSION_TTL = 30 * 24 * 3600
+
+
+# New versions start from the server clock in microseconds, so a lost key
+# never hands out a value that a client may still hold as an ETag
+def bump_version_lua(key: str) -> str:
+    return f"""
+if redis.call('EXISTS', {key}) == 1 then
+    redis.call('INCR', {key})
+else
+    local now = redis.call('TIME')
+    redis.call('SET', {key}, now[1] .. string.format('%06d', now[2]))
+end
+redis.call('EXPIRE', {key}, {VERSION_TTL})
+"""
+
+
+GET_VERSION_SCRIPT = f"""
+local version = redis.call('GET', KEYS[1])
+if not version then
+    local now = redis.call('TIME')
+    version = now[1] .. string.format('%06d', now[2])
+    redis.call('SET', KEYS[1], version, 'EX', {VERSION_TTL})
+end
+return version
+"""
+
+BUMP_VERSION_SCRIPT = bump_version_lua("KEYS[1]")
+
+
+def decode_version(version) -> Optional[str]:
+    return version.decode() if isinstance(version, bytes) else version
+
+
+async def get_version_r(
+    redis: Redis,
+    key: str,
+) -> str:
+    get_version = redis.register_script(GET_VERSION_SCRIPT)
+    return decode_version(await get_version(keys=[key]))
+
+
+async def bump_version_r(
+    redis: Redis,
+    key: str,
+) -> None:
+    bump_version = redis.register_script(BUMP_VERSION_SCRIPT)
+    await bump_version(keys=[key])
+
+
+async def watch_version_r(
+    pipe: Pipeline,
+    key: str,
+    version: str,
+) -> bool:
+    await pipe.watch(key)
+    return decode_version(await pipe.get(key)) == version
@@ -0,0 +1,151 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+
+from jobs.handlers import JOB_HANDLERS
+from jobs.queue import (DRAIN_ORDERED_JOBS, ack_job_r, ack_ordered_job_r,
+                        acquire_ordered_lease_r, delay_drain_r,
+                        has_ordered_jobs_r, heartbeat_r, next_ordered_job_r,
+                        promote_delayed_jobs_r, reclaim_dead_workers_r,
+                        release_ordered_lease_r, requeue_processing_jobs_r,
+                        reserve_job_r, retry_job_r, retry_ordered_job_r)
+from images.variants import shutdown_variants_executor
+from redis_utils.client import close_redis, init_redis
+
+JOBS_WORKER_NAME = os.getenv(
+    "JOBS_WORKER_NAME", f"{socket.gethostname()}:{os.getpid()}"
+)
+JOBS_WORKER_CONCURRENCY = int(os.getenv("JOBS_WORKER_CONCURRENCY", "4"))
+JOBS_POLL_TIMEOUT = 1.0
+JOBS_HEARTBEAT_INTERVAL = 5.0
+JOBS_WORKER_TTL = 30.0
+
+logger = logging.getLogger(__name__)
+
+
+async def run_handler(redis, job: dict) -> None:
+    if job["name"] == DRAIN_ORDERED_JOBS:
+        await drain_ordered_jobs(redis=redis, **job["kwargs"])
+        return
+    handler = JOB_HANDLERS.get(job["name"])
+    if handler is None:
+        raise LookupError(f"Unknown job {job['name']}")
+    await handler(redis=redis, **job["kwargs"])
+
+
+# Returns False when a failed job is waiting for its retry or the lease was
+# lost, either way nothing behind it may run yet
+async def run_ordered_jobs(redis, ordering_key: str, token: str) -> bool:
+    while (raw_job := await next_ordered_job_r(redis=redis, ordering_key=ordering_key)):
+        try:
+            job = json.loads(raw_job)
+            # Other drains queued meanwhile must not cut the retry backoff short
+            if job.get("retry_at", 0) > time.time():
+                return False
+            await run_handler(redis=redis, job=job)
+        except Exception as err:
+            will_retry = await retry_ordered_job_r(
+                redis=redis,
+                ordering_key=ordering_key,
+                token=token,
+                raw_job=raw_job,
+                error=repr(err),
+            )
+            logger.exception(
+                "Ordered job for %s failed, %s",
+                ordering_key, "retrying" if will_retry else "moved to dead letters",
+            )
+            if will_retry:
+                return False
+        else:
+            if not await ack_ordered_job_r(
+                redis=redis, ordering_key=ordering_key, token=token, raw_job=raw_job
+            ):
+                return False
+    return True
+
+
+async def drain_ordered_jobs(redis, ordering_key: str) -> None:
+    while True:
+        token = await acquire_ordered_lease_r(redis=redis, ordering_key=ordering_key)
+        if token is None:
+            await delay_drain_r(redis=redis, ordering_key=ordering_key)
+            return
+        try:
+            drained = await run_ordered_jobs(
+                redis=redis, ordering_key=ordering_key, token=token
+            )
+        finally:
+            await release_ordered_lease_r(
+                redis=redis, ordering_key=ordering_key, token=token
+            )
+        # Drains that found the lease taken while it was held were deferred
+        if not drained or not await has_ordered_jobs_r(
+            redis=redis, ordering_key=ordering_key
+        ):
+            return
+
+
+async def run_job(redis, raw_job: bytes) -> None:
+    try:
+        job = json.loads(raw_job)
+        await run_handler(redis=redis, job=job)
+    except Exception as err:
+        will_retry = await retry_job_r(
+            redis=redis, worker_name=JOBS_WORKER_NAME, raw_job=raw_job, error=repr(err)
+        )
+        logger.exception(
+            "Job %.200r failed, %s",
+            raw_job, "retrying" if will_retry else "moved to dead letters",
+        )
+    else:
+        await ack_job_r(redis=redis, worker_name=JOBS_WORKER_NAME, raw_job=raw_job)
+
+
+async def consume_jobs(redis) -> None:
+    while True:
+        await promote_delayed_jobs_r(redis=redis, now=time.time())
+        raw_job = await reserve_job_r(
+            redis=redis, worker_name=JOBS_WORKER_NAME, timeout=JOBS_POLL_TIMEOUT
+        )
+        if raw_job is not None:
+            await run_job(redis=redis, raw_job=raw_job)
+
+
+# Also hands the jobs of workers that stopped beating back to the queue
+async def keep_alive(redis) -> None:
+    while True:
+        now = time.time()
+        await heartbeat_r(redis=redis, worker_name=JOBS_WORKER_NAME, now=now)
+        requeued = await reclaim_dead_workers_r(
+            redis=redis, now=now, worker_ttl=JOBS_WORKER_TTL
+        )
+        if requeued:
+            logger.info("Requeued %s jobs of dead workers", requeued)
+        await asyncio.sleep(JOBS_HEARTBEAT_INTERVAL)
+
+
+async def run_jobs_worker() -> None:
+    redis = await init_redis(decode_responses=False)
+    try:
+        await heartbeat_r(redis=redis, worker_name=JOBS_WORKER_NAME, now=time.time())
+        requeued = await requeue_processing_jobs_r(
+            redis=redis, worker_name=JOBS_WORKER_NAME
+        )
+        if requeued:
+            logger.info("Requeued %s unfinished jobs", requeued)
+        await asyncio.gather(
+            keep_alive(redis=redis),
+            *(consume_jobs(redis=redis) for _ in range(JOBS_WORKER_CONCURRENCY)),
+        )
+    finally:
+        shutdown_variants_executor()
+        await close_redis(redis)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_jobs_worker())
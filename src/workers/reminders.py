@@ -0,0 +1,31 @@
+import asyncio
+import logging
+import time
+
+from api.users.tasks.crud_redis import pop_due_reminders_r
+from redis_utils.client import close_redis, init_redis
+
+REMINDERS_BATCH_SIZE = 500
+REMINDERS_POLL_INTERVAL = 1.0
+
+logger = logging.getLogger(__name__)
+
+
+async def run_reminders_worker() -> None:
+    redis = await init_redis()
+    try:
+        while True:
+            emitted = await pop_due_reminders_r(
+                redis=redis, now=time.time(), batch_size=REMINDERS_BATCH_SIZE
+            )
+            if emitted:
+                logger.info("Emitted %s task reminders", emitted)
+            if emitted < REMINDERS_BATCH_SIZE:
+                await asyncio.sleep(REMINDERS_POLL_INTERVAL)
+    finally:
+        await close_redis(redis)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_reminders_worker())
@@ -0,0 +1,48 @@
+import argparse
+import asyncio
+import json
+import logging
+from pathlib import Path
+
+from db.engine import engine, session_factory
+from images.config import BLOBS_DIR
+from images.gc import GC_GRACE_SECONDS, collect_orphaned_uploads
+
+UPLOAD_DIR = BLOBS_DIR.parent
+
+logger = logging.getLogger(__name__)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Delete or quarantine uploads no task or user refers to"
+    )
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument(
+        "--quarantine",
+        type=Path,
+        default=None,
+        help="move orphans under this directory instead of deleting them",
+    )
+    parser.add_argument("--grace-seconds", type=int, default=GC_GRACE_SECONDS)
+    return parser.parse_args()
+
+
+async def run_uploads_gc(args: argparse.Namespace) -> None:
+    try:
+        async with session_factory() as session:
+            stats = await collect_orphaned_uploads(
+                session=session,
+                upload_dir=UPLOAD_DIR,
+                quarantine_dir=args.quarantine,
+                dry_run=args.dry_run,
+                grace_seconds=args.grace_seconds,
+            )
+    finally:
+        await engine.dispose()
+    print(json.dumps(stats.summary()))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_uploads_gc(parse_args()))
@@ -0,0 +1,82 @@
+import asyncio
+import json
+
+import fakeredis
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+import api.users.tasks.crud as crud
+from api.users.service import current_user_uuid
+from db.engine import get_session
+from jobs.queue import JOBS_QUEUE_KEY
+from main import app
+
+SEED_USER = text(
+    "INSERT INTO users (email) VALUES ('complete@example.com') RETURNING id"
+)
+SEED_TASKS = text(
+    "INSERT INTO tasks (user_id, title, description, status, priority, deadline) "
+    "SELECT :user_id, 'task ' || n, '', 'NOT_STARTED', 'LOW', current_date "
+    "FROM generate_series(1, 3) n RETURNING id"
+)
+SEED_COMPLETED = text(
+    "INSERT INTO completed_tasks (id, user_id, title, description, priority, deadline, "
+    "img_blob, created_at) VALUES (20000001, :user_id, 'old', '', 'LOW', current_date, "
+    "'evicted.png', now() - interval '1 day') RETURNING id"
+)
+SET_IMG_BLOB = text("UPDATE tasks SET img_blob = :img_blob WHERE id = :task_id")
+
+
+async def seed(pg) -> tuple:
+    async with pg.session_factory() as session, session.begin():
+        user_id = await session.scalar(SEED_USER)
+        task_ids = sorted(await session.scalars(SEED_TASKS, {"user_id": user_id}))
+        await session.execute(
+            SET_IMG_BLOB, {"img_blob": "dropped.png", "task_id": task_ids[0]}
+        )
+        evicted_id = await session.scalar(SEED_COMPLETED, {"user_id": user_id})
+    return str(user_id), task_ids, evicted_id
+
+
+@pytest.fixture
+def client(pg, monkeypatch):
+    user_uuid, task_ids, evicted_id = pg.run(seed(pg))
+
+    async def fixed_user_uuid():
+        return user_uuid
+
+    async def pg_session():
+        async with pg.session_factory() as session:
+            yield session
+
+    monkeypatch.setattr(crud, "COMPLETED_TASKS_LIMIT", 2)
+    app.dependency_overrides[get_session] = pg_session
+    app.dependency_overrides[current_user_uuid] = fixed_user_uuid
+    app.state.redis_bytes = fakeredis.aioredis.FakeRedis()
+    try:
+        yield TestClient(app), task_ids, evicted_id
+    finally:
+        app.dependency_overrides.clear()
+
+
+def test_batch_complete_reports_each_outcome(client):
+    client, (first, second, third), evicted_id = client
+
+    response = client.patch(
+        "/users/tasks/batch/complete_tasks",
+        json={"task_ids": [first, second, third, evicted_id, 404]},
+    )
+
+    assert response.status_code == 200, response.text
+    # Same created_at, so the history keeps the two highest ids
+    assert response.json()["results"] == [
+        {"id": first, "status": "dropped"},
+        {"id": second, "status": "completed"},
+        {"id": third, "status": "completed"},
+        {"id": evicted_id, "status": "not_found"},
+        {"id": 404, "status": "not_found"},
+    ]
+    queued = asyncio.run(app.state.redis_bytes.lrange(JOBS_QUEUE_KEY, 0, -1))
+    job, = [job for job in map(json.loads, queued) if job["name"] == "delete_task_imgs"]
+    assert sorted(job["kwargs"]["old_blobs"]) == ["dropped.png", "evicted.png"]
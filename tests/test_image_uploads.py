@@ -0,0 +1,219 @@
+import io
+import asyncio
+import json
+from collections import namedtuple
+
+import fakeredis
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+from sqlalchemy.sql.dml import Insert, Update
+
+import images.store as store
+from api.users.service import current_user_uuid
+from api.users.tasks.service import serialize_task
+from db.engine import get_session
+from db.models import TaskPriority, TaskStatus, TasksTable, UsersTable
+from images.variants import generate_variants, variant_paths
+from jobs.queue import ordered_key
+from main import app
+
+USER_UUID = "0b4c3f5e-7a61-4d4e-9a38-2f1a6f0d9c11"
+
+TaskRow = namedtuple(
+    "TaskRow",
+    "id title description status priority deadline img_blob old_img_blob",
+)
+UserRow = namedtuple("UserRow", "img_blob old_img_blob")
+
+
+class FakeResult:
+    def __init__(self, row):
+        self.row = row
+
+    def one(self):
+        return self.row
+
+    def one_or_none(self):
+        return self.row
+
+
+class FakeTransaction:
+    def __init__(self, session):
+        self.session = session
+
+    async def __aenter__(self):
+        self.session.in_transaction = True
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.session.in_transaction = False
+        return False
+
+
+# Answers the statements the upload routes issue, keeping the values written
+class FakeSession:
+    def __init__(self):
+        self.statements = []
+        self.in_transaction = False
+
+    def begin(self):
+        return FakeTransaction(self)
+
+    async def execute(self, stmt, *args, **kwargs):
+        self.statements.append(stmt)
+        values = {
+            column.key: param.value
+            for column, param in getattr(stmt, "_values", {}).items()
+        } if isinstance(stmt, Update) else {}
+        if isinstance(stmt, Insert):
+            return FakeResult(self.task_row(img_blob=None))
+        if stmt.table.name == TasksTable.__tablename__:
+            return FakeResult(self.task_row(img_blob=values.get("img_blob")))
+        if stmt.table.name == UsersTable.__tablename__:
+            return FakeResult(UserRow(img_blob=values["img_blob"], old_img_blob=None))
+        raise AssertionError(f"Unexpected statement {stmt}")
+
+    def task_row(self, img_blob):
+        return TaskRow(
+            id=7,
+            title="Buy milk",
+            description=None,
+            status=TaskStatus.NOT_STARTED,
+            priority=TaskPriority.LOW,
+            deadline=None,
+            img_blob=img_blob,
+            old_img_blob=None,
+        )
+
+    def written_blobs(self):
+        return [
+            param.value
+            for stmt in self.statements
+            if isinstance(stmt, Update)
+            for column, param in stmt._values.items()
+            if column.key == "img_blob"
+        ]
+
+    async def close(self):
+        pass
+
+
+def png_bytes() -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (32, 32), (200, 40, 40)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+async def fixed_user_uuid():
+    return USER_UUID
+
+
+@pytest.fixture
+def session():
+    return FakeSession()
+
+
+@pytest.fixture
+def client(session, tmp_path, monkeypatch):
+    monkeypatch.setattr(store, "BLOBS_DIR", tmp_path / "blobs")
+    monkeypatch.setattr(store, "BLOBS_TMP_DIR", tmp_path / "blobs" / ".tmp")
+
+    async def generate_outside_transaction(source, target):
+        assert not session.in_transaction
+        await generate_variants(source=source, target=target)
+
+    monkeypatch.setattr(store, "generate_variants", generate_outside_transaction)
+
+    async def fake_session():
+        yield session
+
+    app.dependency_overrides[get_session] = fake_session
+    app.dependency_overrides[current_user_uuid] = fixed_user_uuid
+    app.state.redis = fakeredis.aioredis.FakeRedis(decode_responses=True)
+    app.state.redis_bytes = fakeredis.aioredis.FakeRedis()
+    try:
+        yield TestClient(app)
+    finally:
+        app.dependency_overrides.clear()
+
+
+def assert_blob_stored(session, tmp_path):
+    img_blob, = session.written_blobs()
+    assert img_blob.endswith(".png")
+    assert store.blob_path(img_blob).is_file()
+    assert store.blob_path(img_blob).is_relative_to(tmp_path)
+    assert all(path.is_file() for path in variant_paths(store.blob_path(img_blob)))
+    assert list(store.BLOBS_TMP_DIR.iterdir()) == []
+    return img_blob
+
+
+def test_create_task_with_image(client, session, tmp_path):
+    response = client.post(
+        "/users/tasks/create_task",
+        data={
+            "title": "Buy milk",
+            "description": "Two litres",
+            "priority": "LOW",
+            "deadline": "01/12/2026",
+        },
+        files={"task_img": ("milk.png", png_bytes(), "image/png")},
+    )
+
+    assert response.status_code == 200, response.text
+    img_blob = assert_blob_stored(session, tmp_path)
+    job = json.loads(asyncio.run(
+        app.state.redis_bytes.lindex(ordered_key(USER_UUID), 0)
+    ))
+    task, = job["kwargs"]["upserted"]
+    variants = task["task_img_variants"]
+    assert variants["256"] == store.blob_url(img_blob).replace(".png", "_256.webp")
+
+
+def test_edit_task_image(client, session, tmp_path):
+    response = client.patch(
+        "/users/tasks/edit_task/7",
+        data={"title": "Buy oat milk"},
+        files={"task_img": ("milk.png", png_bytes(), "image/png")},
+    )
+
+    assert response.status_code == 200, response.text
+    assert_blob_stored(session, tmp_path)
+
+
+def test_set_avatar(client, session, tmp_path):
+    response = client.patch(
+        "/users/set_avatar",
+        files={"profile_pic": ("me.png", png_bytes(), "image/png")},
+    )
+
+    assert response.status_code == 200, response.text
+    assert_blob_stored(session, tmp_path)
+
+
+def test_rejects_non_image_upload(client, session):
+    response = client.patch(
+        "/users/set_avatar",
+        files={"profile_pic": ("me.png", b"not an image", "image/png")},
+    )
+
+    assert response.status_code == 400
+    assert session.written_blobs() == []
+
+
+def test_rejects_undecodable_image(client, session):
+    response = client.patch(
+        "/users/set_avatar",
+        files={"profile_pic": ("me.png", png_bytes()[:40], "image/png")},
+    )
+
+    assert response.status_code == 400
+
+
+def test_legacy_task_image_has_no_variants(session):
+    task = asyncio.run(
+        serialize_task(task=session.task_row(img_blob=None), user_uuid=USER_UUID)
+    )
+
+    assert task["task_img"].endswith(f"7_{USER_UUID}.jpeg")
+    assert task["task_img_variants"] is None
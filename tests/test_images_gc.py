@@ -0,0 +1,110 @@
+import os
+import time
+
+import pytest
+from sqlalchemy import text
+
+from images import gc, store
+
+OLD = time.time() - 2 * gc.GC_GRACE_SECONDS
+KEPT = "a1" * 32
+ORPHAN = "b2" * 32
+RELEASED = "c3" * 32
+RECENT = "d4" * 32
+
+
+@pytest.fixture
+def blobs_dir(tmp_path, monkeypatch):
+    upload_dir = tmp_path / "uploads"
+    for module in (gc, store):
+        monkeypatch.setattr(module, "BLOBS_DIR", upload_dir / "blobs")
+    monkeypatch.setattr(gc, "TASK_UPLOAD_DIR", upload_dir / "tasks")
+    monkeypatch.setattr(gc, "PROFILE_PHOTO_UPLOAD_DIR", upload_dir / "avatars")
+    return upload_dir
+
+
+def write_blob(digest: str, mtime: float = OLD) -> list:
+    original = store.blob_path(store.blob_name(digest, "png"))
+    paths = [original, original.with_name(f"{digest}_256.webp")]
+    for path in paths:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"image")
+        os.utime(path, (mtime, mtime))
+    return paths
+
+
+async def seed(pg) -> None:
+    async with pg.session_factory() as session, session.begin():
+        user_id = await session.scalar(
+            text("INSERT INTO users (email) VALUES ('gc@example.com') RETURNING id")
+        )
+        await session.execute(
+            text(
+                "INSERT INTO tasks (user_id, title, description, status, priority, deadline, img_blob) "
+                "VALUES (:user_id, 'gc', '', 'NOT_STARTED', 'LOW', current_date, :name)"
+            ),
+            {"user_id": user_id, "name": store.blob_name(KEPT, "png")},
+        )
+        await session.execute(
+            text("INSERT INTO image_blobs (name, ref_count) VALUES (:name, 0)"),
+            {"name": store.blob_name(RELEASED, "png")},
+        )
+
+
+async def collect(pg, upload_dir, **kwargs) -> gc.GCStats:
+    async with pg.session_factory() as session:
+        return await gc.collect_orphaned_uploads(
+            session=session, upload_dir=upload_dir, **kwargs
+        )
+
+
+async def blob_rows(pg) -> dict:
+    async with pg.session_factory() as session:
+        rows = await session.execute(text("SELECT name, ref_count FROM image_blobs"))
+        digests = (KEPT, ORPHAN, RELEASED, RECENT)
+        return {
+            name: ref_count
+            for name, ref_count in rows.all()
+            if name.startswith(digests)
+        }
+
+
+def test_gc_releases_orphans_under_row_locks(pg, blobs_dir, monkeypatch):
+    pg.run(seed(pg))
+    kept, orphan, released, recent = (
+        write_blob(KEPT), write_blob(ORPHAN), write_blob(RELEASED),
+        write_blob(RECENT, mtime=time.time()),
+    )
+
+    # A snapshot that misses the reference, as if the upload committed after it
+    async def stale_snapshot(session):
+        return set()
+
+    monkeypatch.setattr(gc, "referenced_blobs", stale_snapshot)
+    stats = pg.run(collect(pg, blobs_dir))
+
+    assert all(path.exists() for path in kept + recent)
+    assert not any(path.exists() for path in orphan + released)
+    assert stats.orphans == 4
+    rows = pg.run(blob_rows(pg))
+    assert rows == {store.blob_name(KEPT, "png"): 1}
+
+
+def test_gc_dry_run_keeps_files(pg, blobs_dir):
+    orphan = write_blob(ORPHAN)
+
+    stats = pg.run(collect(pg, blobs_dir, dry_run=True))
+
+    assert all(path.exists() for path in orphan)
+    assert stats.orphans == 2
+
+
+def test_gc_quarantines_blob_variants(pg, blobs_dir, tmp_path):
+    orphan = write_blob(ORPHAN)
+    quarantine_dir = tmp_path / "quarantine"
+
+    pg.run(collect(pg, blobs_dir, quarantine_dir=quarantine_dir))
+
+    for path in orphan:
+        assert not path.exists()
+        assert (quarantine_dir / path.relative_to(blobs_dir)).exists()
@@ -0,0 +1,132 @@
+import asyncio
+import io
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from api.users.tasks.crud import IMPORT_STAGING_TABLE, copy_tasks_to_db
+from api.users.tasks.service import (ImportReport, ImportTooLargeError,
+                                     parse_import_rows)
+
+USER_UUID = "0b4c3f5e-7a61-4d4e-9a38-2f1a6f0d9c11"
+
+
+class FakeResult:
+    def all(self):
+        return []
+
+
+class FakeTransaction:
+    def __init__(self, calls):
+        self.calls = calls
+
+    async def __aenter__(self):
+        self.calls.append(("begin",))
+        return self
+
+    async def __aexit__(self, exc_type, *exc_info):
+        self.calls.append(("rollback",) if exc_type else ("commit",))
+        return False
+
+
+class FakeDriverConnection:
+    def __init__(self, calls):
+        self.calls = calls
+
+    async def copy_records_to_table(self, table_name, records, columns):
+        self.calls.append(("copy", table_name, len(records)))
+
+
+class FakeConnection:
+    def __init__(self, calls):
+        self.driver_connection = FakeDriverConnection(calls)
+
+    async def get_raw_connection(self):
+        return self
+
+
+class FakeSession:
+    def __init__(self):
+        self.calls = []
+
+    def begin(self):
+        return FakeTransaction(self.calls)
+
+    async def connection(self):
+        return FakeConnection(self.calls)
+
+    async def execute(self, stmt, *args, **kwargs):
+        self.calls.append(("execute", str(stmt.compile(dialect=postgresql.dialect()))))
+        return FakeResult()
+
+
+def records(count, fail_after=None):
+    for number in range(count):
+        if number == fail_after:
+            raise UnicodeDecodeError("utf-8", b"\xff", 0, 1, "invalid start byte")
+        yield (USER_UUID, f"task {number}", None, "NOT_STARTED", "LOW", None)
+
+
+def test_copies_into_staging_inside_the_transaction():
+    session = FakeSession()
+
+    imported, _ = asyncio.run(
+        copy_tasks_to_db(
+            session=session, user_uuid=USER_UUID, records=records(5), chunk_size=2
+        )
+    )
+
+    assert imported == 5
+    kinds = [call[0] for call in session.calls]
+    assert kinds == ["begin", "execute", "copy", "copy", "copy", "execute", "commit"]
+    assert "CREATE TEMP TABLE" in session.calls[1][1]
+    assert {call[1] for call in session.calls if call[0] == "copy"} == {
+        IMPORT_STAGING_TABLE
+    }
+    assert "INSERT INTO tasks" in session.calls[-2][1]
+    assert "RETURNING tasks.id" in session.calls[-2][1]
+
+
+def test_failed_chunk_rolls_back_earlier_chunks():
+    session = FakeSession()
+
+    with pytest.raises(UnicodeDecodeError):
+        asyncio.run(
+            copy_tasks_to_db(
+                session=session,
+                user_uuid=USER_UUID,
+                records=records(5, fail_after=3),
+                chunk_size=2,
+            )
+        )
+
+    assert [call[0] for call in session.calls] == [
+        "begin", "execute", "copy", "rollback"
+    ]
+
+
+def test_reports_only_the_first_errors():
+    report = ImportReport(max_errors=2)
+    task_file = io.BytesIO(b"not json\n" * 5)
+
+    rows = list(parse_import_rows(
+        task_file=task_file, import_format="ndjson", user_uuid=USER_UUID, report=report
+    ))
+
+    assert rows == []
+    assert report.rejected == 5
+    assert [error["row"] for error in report.errors] == [1, 2]
+
+
+def test_rejects_files_over_the_row_limit():
+    task_file = io.BytesIO(b"not json\n" * 3)
+    rows = parse_import_rows(
+        task_file=task_file,
+        import_format="ndjson",
+        user_uuid=USER_UUID,
+        report=ImportReport(),
+        max_rows=2,
+    )
+
+    with pytest.raises(ImportTooLargeError):
+        list(rows)
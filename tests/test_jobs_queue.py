@@ -0,0 +1,152 @@
+import asyncio
+import json
+import time
+
+import fakeredis
+import pytest
+
+from jobs.handlers import JOB_HANDLERS
+from jobs.queue import (JOB_MAX_ATTEMPTS, JOBS_DEAD_KEY, JOBS_DELAYED_KEY,
+                        JOBS_QUEUE_KEY, JOBS_WORKERS_KEY,
+                        acquire_ordered_lease_r, enqueue_job_r, heartbeat_r,
+                        ordered_key, promote_delayed_jobs_r,
+                        reclaim_dead_workers_r, reserve_job_r)
+from jobs import queue
+from workers import jobs as worker
+
+USER_UUID = "0b4c3f5e-7a61-4d4e-9a38-2f1a6f0d9c11"
+
+
+@pytest.fixture
+def redis():
+    return fakeredis.aioredis.FakeRedis()
+
+
+class Runs(list):
+    failures: dict
+
+
+@pytest.fixture
+def record_runs(monkeypatch):
+    runs = Runs()
+    runs.failures = {}
+
+    async def record(redis, step: int):
+        runs.append(step)
+        if runs.failures.get(step, 0):
+            runs.failures[step] -= 1
+            raise RuntimeError(f"step {step} failed")
+
+    monkeypatch.setitem(JOB_HANDLERS, "record", record)
+    return runs
+
+
+async def work(redis, now=None) -> None:
+    await promote_delayed_jobs_r(redis=redis, now=now or time.time())
+    while raw_job := await reserve_job_r(
+        redis=redis, worker_name=worker.JOBS_WORKER_NAME, timeout=0.01
+    ):
+        await worker.run_job(redis=redis, raw_job=raw_job)
+
+
+async def enqueue_steps(redis, steps) -> None:
+    for step in steps:
+        await enqueue_job_r(
+            redis=redis, name="record", ordering_key=USER_UUID, step=step
+        )
+
+
+def test_ordered_jobs_run_in_enqueue_order(redis, record_runs):
+    async def scenario():
+        await enqueue_steps(redis, [1, 2, 3])
+        await work(redis)
+
+    asyncio.run(scenario())
+
+    assert record_runs == [1, 2, 3]
+
+
+def test_failed_ordered_job_blocks_later_jobs_until_retried(
+    redis, record_runs, monkeypatch
+):
+    monkeypatch.setattr(queue, "JOB_RETRY_BASE_DELAY", 0.2)
+    record_runs.failures[1] = 1
+
+    async def scenario():
+        await enqueue_steps(redis, [1, 2])
+        await work(redis)
+        assert record_runs == [1]
+        assert await redis.llen(ordered_key(USER_UUID)) == 2
+        await asyncio.sleep(0.25)
+        await work(redis)
+
+    asyncio.run(scenario())
+
+    assert record_runs == [1, 1, 2]
+
+
+def test_ordered_job_dead_lettered_after_max_attempts(
+    redis, record_runs, monkeypatch
+):
+    monkeypatch.setattr(queue, "JOB_RETRY_BASE_DELAY", 0.001)
+    record_runs.failures[1] = JOB_MAX_ATTEMPTS
+
+    async def scenario():
+        await enqueue_steps(redis, [1, 2])
+        while await redis.exists(ordered_key(USER_UUID)):
+            await asyncio.sleep(0.02)
+            await work(redis)
+        return [json.loads(job) for job in await redis.lrange(JOBS_DEAD_KEY, 0, -1)]
+
+    dead = asyncio.run(scenario())
+
+    assert record_runs == [1] * JOB_MAX_ATTEMPTS + [2]
+    assert [job["kwargs"]["step"] for job in dead] == [1]
+
+
+def test_drain_is_deferred_while_the_lease_is_held(redis, record_runs):
+    async def scenario():
+        await acquire_ordered_lease_r(redis=redis, ordering_key=USER_UUID)
+        await enqueue_steps(redis, [1])
+        await work(redis)
+        assert record_runs == []
+        assert await redis.zcard(JOBS_DELAYED_KEY) == 1
+        await redis.delete(f"jobs:ordered:{USER_UUID}:lease")
+        await work(redis, now=time.time() + 60)
+        assert await redis.llen(JOBS_QUEUE_KEY) == 0
+
+    asyncio.run(scenario())
+
+    assert record_runs == [1]
+
+
+def test_jobs_of_dead_workers_are_requeued(redis):
+    async def scenario():
+        await enqueue_job_r(redis=redis, name="record", step=1)
+        await heartbeat_r(redis=redis, worker_name="old-host:1", now=time.time() - 60)
+        await reserve_job_r(redis=redis, worker_name="old-host:1", timeout=0.01)
+        await heartbeat_r(redis=redis, worker_name="live-host:1", now=time.time())
+
+        requeued = await reclaim_dead_workers_r(
+            redis=redis, now=time.time(), worker_ttl=worker.JOBS_WORKER_TTL
+        )
+        workers = await redis.zrange(JOBS_WORKERS_KEY, 0, -1)
+        return requeued, await redis.llen(JOBS_QUEUE_KEY), workers
+
+    requeued, queued, workers = asyncio.run(scenario())
+
+    assert (requeued, queued) == (1, 1)
+    assert workers == [b"live-host:1"]
+
+
+@pytest.mark.parametrize("raw_job", [b"{not json", b"[1, 2]", b'{"name": "record"}'])
+def test_malformed_jobs_are_dead_lettered(redis, raw_job):
+    async def scenario():
+        await redis.lpush(JOBS_QUEUE_KEY, raw_job)
+        await work(redis)
+        return [json.loads(job) for job in await redis.lrange(JOBS_DEAD_KEY, 0, -1)]
+
+    dead = asyncio.run(scenario())
+
+    assert len(dead) == 1
+    assert dead[0]["raw"] == raw_job.decode()
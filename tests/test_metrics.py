@@ -0,0 +1,43 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from api.metrics.config import metrics_config
+from main import app
+
+TOKEN = "metrics-secret"
+
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+
+def test_db_pool_metrics_disabled_without_token(client, monkeypatch):
+    monkeypatch.setattr(metrics_config, "METRICS_TOKEN", None)
+
+    response = client.get(
+        "/metrics/db_pool", headers={"Authorization": "Bearer anything"}
+    )
+
+    assert response.status_code == 404
+
+
+@pytest.mark.parametrize("authorization", [None, "Bearer wrong", TOKEN])
+def test_db_pool_metrics_rejects_bad_token(client, monkeypatch, authorization):
+    monkeypatch.setattr(metrics_config, "METRICS_TOKEN", TOKEN)
+    headers = {"Authorization": authorization} if authorization else {}
+
+    response = client.get("/metrics/db_pool", headers=headers)
+
+    assert response.status_code == 401
+
+
+def test_db_pool_metrics_with_token(client, monkeypatch):
+    monkeypatch.setattr(metrics_config, "METRICS_TOKEN", TOKEN)
+
+    response = client.get(
+        "/metrics/db_pool", headers={"Authorization": f"Bearer {TOKEN}"}
+    )
+
+    assert response.status_code == 200
+    assert "primary" in response.json()
@@ -0,0 +1,161 @@
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import event, text
+
+from api.users.tasks import crud
+
+USERS = 200
+TASKS_PER_USER = 60
+COMPLETED_PER_USER = 30
+
+SEED_USERS = text(
+    "INSERT INTO users (email) "
+    "SELECT 'user' || n || '@example.com' FROM generate_series(1, :users) n"
+)
+SEED_TASKS = text(
+    "INSERT INTO tasks (user_id, title, description, status, priority, deadline) "
+    "SELECT u.id, 'task ' || n, 'description ' || n, "
+    "(ARRAY['NOT_STARTED', 'IN_PROGRESS', 'DONE'])[1 + n % 3]::taskstatus, "
+    "(ARRAY['LOW', 'MODERATE', 'EXTREME'])[1 + n % 3]::taskpriority, "
+    "current_date + n % 90 "
+    "FROM users u CROSS JOIN generate_series(1, :per_user) n"
+)
+SEED_COMPLETED = text(
+    "INSERT INTO completed_tasks (id, user_id, title, description, priority, deadline) "
+    "SELECT 10000000 + row_number() OVER (), u.id, 'done ' || n, 'description ' || n, "
+    "'LOW'::taskpriority, current_date - n "
+    "FROM users u CROSS JOIN generate_series(1, :per_user) n"
+)
+
+
+def plan_nodes(plan: dict):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+# Runs call(session) for real, then EXPLAINs every statement it sent
+async def explain_calls(pg, call) -> list:
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(pg.engine.sync_engine, "before_cursor_execute", capture)
+    try:
+        async with pg.session_factory() as session:
+            await call(session)
+    finally:
+        event.remove(pg.engine.sync_engine, "before_cursor_execute", capture)
+
+    plans = []
+    async with pg.engine.connect() as connection:
+        # Tables this small may be scanned anyway; this only fails without an index
+        await connection.exec_driver_sql("SET enable_seqscan = off")
+        for statement, parameters in statements:
+            result = await connection.exec_driver_sql(
+                f"EXPLAIN (FORMAT JSON) {statement}", parameters
+            )
+            plans.append((statement, result.scalar()[0]["Plan"]))
+        await connection.rollback()
+    return plans
+
+
+def assert_no_seq_scans(plans: list) -> None:
+    assert plans
+    for statement, plan in plans:
+        scans = [
+            node["Relation Name"]
+            for node in plan_nodes(plan)
+            if node["Node Type"] == "Seq Scan"
+        ]
+        assert not scans, f"Seq Scan on {scans} in:\n{statement}"
+
+
+@pytest.fixture(scope="module")
+def seeded(pg):
+    async def seed():
+        async with pg.engine.begin() as connection:
+            await connection.execute(SEED_USERS, {"users": USERS})
+            await connection.execute(SEED_TASKS, {"per_user": TASKS_PER_USER})
+            await connection.execute(SEED_COMPLETED, {"per_user": COMPLETED_PER_USER})
+            await connection.execute(text("ANALYZE"))
+            user_uuid = await connection.scalar(text("SELECT id FROM users LIMIT 1"))
+            task_ids = (
+                await connection.scalars(
+                    text(
+                        "SELECT id FROM tasks WHERE user_id = :user_id "
+                        "AND status <> 'DONE' ORDER BY id LIMIT 6"
+                    ),
+                    {"user_id": user_uuid},
+                )
+            ).all()
+        return str(user_uuid), task_ids
+
+    return pg.run(seed())
+
+
+HOT_QUERIES = {
+    "select_all_tasks": lambda session, user_uuid, task_ids: crud.select_all_tasks(
+        session=session, user_uuid=user_uuid
+    ),
+    "select_tasks_page": lambda session, user_uuid, task_ids: crud.select_tasks_page(
+        session=session, user_uuid=user_uuid, limit=20
+    ),
+    "select_vital_tasks": lambda session, user_uuid, task_ids: crud.select_vital_tasks(
+        session=session, user_uuid=user_uuid
+    ),
+    "select_due_tasks": lambda session, user_uuid, task_ids: crud.select_due_tasks(
+        session=session,
+        user_uuid=user_uuid,
+        due_before=date.today() + timedelta(days=7),
+        due_after=date.today(),
+        limit=50,
+    ),
+    "change_task_status": lambda session, user_uuid, task_ids: crud.change_task_status(
+        session=session, user_uuid=user_uuid, task_id=task_ids[0]
+    ),
+    "edit_task_data": lambda session, user_uuid, task_ids: crud.edit_task_data(
+        session=session,
+        user_uuid=user_uuid,
+        task_id=task_ids[1],
+        task_data={"title": "edited"},
+    ),
+    "complete_tasks_db": lambda session, user_uuid, task_ids: crud.complete_tasks_db(
+        session=session, user_uuid=user_uuid, task_ids=task_ids[2:4]
+    ),
+    "delete_tasks_db": lambda session, user_uuid, task_ids: crud.delete_tasks_db(
+        session=session, user_uuid=user_uuid, task_ids=task_ids[4:6]
+    ),
+}
+
+
+@pytest.mark.parametrize("name", HOT_QUERIES)
+def test_hot_queries_use_indexes(pg, seeded, name):
+    user_uuid, task_ids = seeded
+
+    plans = pg.run(
+        explain_calls(
+            pg, lambda session: HOT_QUERIES[name](session, user_uuid, task_ids)
+        )
+    )
+
+    assert_no_seq_scans(plans)
+
+
+def test_search_uses_trigram_indexes(pg, seeded):
+    if not pg.has_trgm:
+        pytest.skip("pg_trgm is not available")
+    user_uuid, _ = seeded
+
+    plans = pg.run(
+        explain_calls(
+            pg,
+            lambda session: crud.search_tasks_by_name(
+                session=session, user_uuid=user_uuid, task_name="task 1"
+            ),
+        )
+    )
+
+    assert_no_seq_scans(plans)
@@ -0,0 +1,78 @@
+import asyncio
+from datetime import date, timedelta
+
+import fakeredis
+import pytest
+
+from api.users.tasks.crud_redis import (REMINDER_SENT_KEEP_SECONDS, TASK_DEADLINES_KEY,
+                                        TASK_REMINDERS_STREAM, pop_due_reminders_r,
+                                        reminder_member, reminder_score,
+                                        reminder_sent_key, schedule_reminders_r)
+
+USER_UUID = "0b4c3f5e-7a61-4d4e-9a38-2f1a6f0d9c11"
+DEADLINE = date(2026, 3, 10)
+
+
+@pytest.fixture
+def redis():
+    return fakeredis.aioredis.FakeRedis(decode_responses=True)
+
+
+def test_sent_reminder_expires_after_the_deadline(redis):
+    score = reminder_score(DEADLINE)
+    sent_key = reminder_sent_key(reminder_member(USER_UUID, 1))
+
+    async def scenario():
+        await schedule_reminders_r(
+            redis=redis, user_uuid=USER_UUID, deadlines={1: DEADLINE}, now=score - 60
+        )
+        assert await pop_due_reminders_r(redis=redis, now=score, batch_size=10) == 1
+        ttl = await redis.ttl(sent_key)
+        # Rescheduling the same deadline does not send it again
+        await schedule_reminders_r(
+            redis=redis, user_uuid=USER_UUID, deadlines={1: DEADLINE}, now=score + 60
+        )
+        return ttl, await redis.zcard(TASK_DEADLINES_KEY), await redis.xlen(TASK_REMINDERS_STREAM)
+
+    ttl, pending, sent = asyncio.run(scenario())
+    assert 0 < ttl <= REMINDER_SENT_KEEP_SECONDS
+    assert pending == 0
+    assert sent == 1
+
+
+def test_moved_deadline_is_reminded_again(redis):
+    moved = DEADLINE + timedelta(days=7)
+    member = reminder_member(USER_UUID, 1)
+
+    async def scenario():
+        now = reminder_score(DEADLINE)
+        await schedule_reminders_r(
+            redis=redis, user_uuid=USER_UUID, deadlines={1: DEADLINE}, now=now
+        )
+        await pop_due_reminders_r(redis=redis, now=now, batch_size=10)
+        await schedule_reminders_r(
+            redis=redis, user_uuid=USER_UUID, deadlines={1: moved}, now=now
+        )
+        return await redis.zscore(TASK_DEADLINES_KEY, member), await redis.exists(
+            reminder_sent_key(member)
+        )
+
+    score, sent = asyncio.run(scenario())
+    assert score == reminder_score(moved)
+    assert sent == 0
+
+
+def test_long_past_deadlines_are_not_scheduled(redis):
+    member = reminder_member(USER_UUID, 1)
+    now = reminder_score(DEADLINE) + REMINDER_SENT_KEEP_SECONDS + 1
+
+    async def scenario():
+        await redis.zadd(TASK_DEADLINES_KEY, {member: reminder_score(DEADLINE)})
+        await schedule_reminders_r(
+            redis=redis, user_uuid=USER_UUID, deadlines={1: DEADLINE}, now=now
+        )
+        return await redis.zcard(TASK_DEADLINES_KEY), await pop_due_reminders_r(
+            redis=redis, now=now, batch_size=10
+        )
+
+    assert asyncio.run(scenario()) == (0, 0)
@@ -0,0 +1,73 @@
+import asyncio
+import json
+
+import fakeredis
+import pytest
+from fastapi import BackgroundTasks
+
+from api.users.tasks.crud_redis import get_tasks_r, task_field, update_tasks_r
+
+USER_UUID = "0b4c3f5e-7a61-4d4e-9a38-2f1a6f0d9c11"
+
+
+def make_task(task_id: int, status: str = "NOT_STARTED") -> dict:
+    return {
+        "id": task_id,
+        "title": f"Task {task_id}",
+        "description": "",
+        "status": status,
+        "priority": "LOW",
+        "deadline": "24/12/2026",
+        "task_img": None,
+        "task_img_variants": None,
+    }
+
+
+# Completed task ids keep the id they had while open, so they interleave
+COMPLETED = {task_field(task_id, completed=True): make_task(task_id, "DONE")
+             for task_id in (9, 2)}
+OPEN = {task_field(task_id): make_task(task_id) for task_id in (5, 1, 12)}
+
+
+@pytest.fixture
+def redis():
+    return fakeredis.aioredis.FakeRedis()
+
+
+def loaded_ids(body: bytes) -> list:
+    return [task["id"] for task in json.loads(body)]
+
+
+def get_tasks(redis, tasks: dict) -> bytes:
+    async def loader():
+        return tasks
+
+    return asyncio.run(get_tasks_r(
+        redis=redis,
+        user_uuid=USER_UUID,
+        loader=loader,
+        background_tasks=BackgroundTasks(),
+    ))
+
+
+def test_cache_hit_matches_rebuild_order(redis):
+    rebuilt = get_tasks(redis, {**OPEN, **COMPLETED})
+    cached = get_tasks(redis, {})
+
+    assert loaded_ids(rebuilt) == [2, 9, 1, 5, 12]
+    assert cached == rebuilt
+
+
+def test_completed_task_moves_ahead_of_open_tasks(redis):
+    get_tasks(redis, {**COMPLETED, **OPEN})
+
+    asyncio.run(update_tasks_r(
+        redis=redis,
+        user_uuid=USER_UUID,
+        upserted=[make_task(5, "DONE")],
+        removed_ids=[9],
+        completed=True,
+    ))
+    cached = get_tasks(redis, {})
+
+    assert loaded_ids(cached) == [2, 5, 1, 12]